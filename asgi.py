@@ -0,0 +1,22 @@
+"""
+ASGI entry point, e.g., `uvicorn asgi:app --workers 4`.
+
+The same app as `wsgi.py`, see `kerkoapp.asgi`.
+"""
+
+import errno
+import sys
+
+from kerkoapp import apply_proxy_fix, create_app
+from kerkoapp.asgi import AsgiApp
+
+try:
+    flask_app = create_app()
+except RuntimeError as e:
+    print(e, file=sys.stderr)  # noqa: T201
+    sys.exit(errno.EINTR)  # This should make the ASGI server exit as well.
+
+
+apply_proxy_fix(flask_app)
+
+app = AsgiApp(flask_app)
@@ -0,0 +1,7 @@
+"""
+Benchmarks for KerkoApp.
+
+Each module can be run on its own, e.g., `python -m benchmarks.extra`. A module
+exits with a non-zero status when a result falls outside its expected bounds,
+so that benchmarks may serve as regression gates.
+"""
@@ -0,0 +1,221 @@
+"""
+Benchmark the citation lookups against a local stub of the OpenAlex API.
+
+Run with `python -m benchmarks.citations`. A stub server, answering like
+OpenAlex's `/works` endpoints after a simulated latency, and failing a share of
+the requests with retryable errors, serves synthetic DOIs. The lookups of
+`kerkoapp.enrichment` then get timed, one DOI at a time (on a subset of the
+DOIs, since this is slow by design) and in concurrent batches, as configured.
+Two more runs check that a run with a complete state has nothing left to look
+up, and that a full run gets unchanged batches confirmed through their ETags.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from kerkoapp.config_helpers import CitationsModel
+from kerkoapp.enrichment import (
+    CitationClient,
+    apply_lookup,
+    lookup_batches,
+    new_state,
+    plan_batches,
+)
+
+DEFAULT_SIZE = 2000
+
+SERIAL_SIZE = 100
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # noqa: N802
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+            fail = stub.rng.random() < stub.error_rate
+        time.sleep(stub.latency)
+        if fail:
+            self.send_body(503, b"", {"Retry-After": "0"})
+            return
+        url = urlsplit(self.path)
+        if url.path.startswith("/works/doi:"):
+            work = stub.get_work(unquote(url.path[len("/works/doi:") :]))
+            if work is None:
+                self.send_body(404, b"")
+                return
+            body = json.dumps(work).encode()
+        elif url.path == "/works":
+            filter_value = parse_qs(url.query).get("filter", [""])[0]
+            dois = filter_value.removeprefix("doi:").split("|")
+            works = [work for work in map(stub.get_work, dois) if work is not None]
+            body = json.dumps({"meta": {"count": len(works)}, "results": works}).encode()
+        else:
+            self.send_body(404, b"")
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            with stub.lock:
+                stub.not_modified += 1
+            self.send_body(304, b"", {"ETag": etag})
+        else:
+            self.send_body(200, body, {"ETag": etag, "Content-Type": "application/json"})
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+
+class StubServer:
+    """OpenAlex-like API, knowing most synthetic DOIs, in a background thread."""
+
+    def __init__(self, latency, error_rate, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def get_work(self, doi):
+        n = int(hashlib.sha1(doi.encode()).hexdigest()[:8], 16)
+        if n % 10 == 0:
+            return None  # Unknown to OpenAlex
+        return {
+            "id": f"https://openalex.org/W{n}",
+            "doi": f"https://doi.org/{doi}",
+            "cited_by_count": n % 500,
+            "referenced_works_count": n % 60,
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = 0
+            self.not_modified = 0
+
+
+def run(stub, dois, settings, state, full=False):
+    """Look up the DOIs due, and return what happened."""
+    stub.reset_counts()
+    batches = plan_batches(dois, state, settings.batch_size, settings.max_age, full=full)
+    outcomes = {"found": 0, "unchanged": 0, "failed": 0}
+
+    def on_batch(batch, values, etag, error):
+        if error:
+            outcomes["failed"] += 1
+        else:
+            outcomes["unchanged" if values is None else "found"] += 1
+            apply_lookup(state, batch, values, etag)
+
+    client = CitationClient(settings)
+    start_time = time.perf_counter()
+    try:
+        lookup_batches(client, batches, on_batch)
+    finally:
+        client.close()
+    return SimpleNamespace(
+        elapsed=time.perf_counter() - start_time,
+        dois=sum(len(batch.dois) for batch in batches),
+        batches=len(batches),
+        requests=stub.requests,
+        not_modified=stub.not_modified,
+        retries=client.retries,
+        **outcomes,
+    )
+
+
+def print_result(name, result):
+    rate = result.dois / result.elapsed if result.elapsed else 0
+    print(  # noqa: T201
+        f"  {name:<12} {result.dois:>7} {result.batches:>8} {result.requests:>9} "
+        f"{result.retries:>8} {result.not_modified:>6} {result.failed:>7} "
+        f"{result.elapsed:>9.2f} {rate:>9.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Number of DOIs.")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Latency of the stub, in seconds."
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.05, help="Share of requests failing with a 503."
+    )
+    parser.add_argument("--batch-size", type=int, default=CitationsModel().batch_size)
+    parser.add_argument("--workers", type=int, default=CitationsModel().workers)
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=1000.0,
+        help="Requests per second (default: practically unlimited, unlike the real API).",
+    )
+    args = parser.parse_args()
+
+    dois = {f"10.5555/synthetic.{n}" for n in range(args.size)}
+    with StubServer(args.latency, args.error_rate) as stub:
+        settings = CitationsModel(
+            api_url=stub.url,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            rate_limit=args.rate_limit,
+            backoff=0.01,
+        )
+        serial_settings = settings.model_copy(update={"batch_size": 1, "workers": 1})
+        serial_dois = set(sorted(dois)[:SERIAL_SIZE])
+
+        print(  # noqa: T201
+            f"  {'run':<12} {'DOIs':>7} {'batches':>8} {'requests':>9} "
+            f"{'retries':>8} {'304s':>6} {'failed':>7} {'seconds':>9} {'DOIs/s':>9}"
+        )
+        print_result("serial", run(stub, serial_dois, serial_settings, new_state()))
+        state = new_state()
+        results = {"batched": run(stub, dois, settings, state)}
+        results["resumed"] = run(stub, dois, settings, state)
+        results["full"] = run(stub, dois, settings, state, full=True)
+        for name, result in results.items():
+            print_result(name, result)
+
+    found = sum(1 for entry in state["works"].values() if entry["values"])
+    print(f"\n{found} of {len(dois)} DOIs found.")  # noqa: T201
+    if results["resumed"].dois or any(r.failed for r in results.values()):
+        print("FAIL: lookups left over or failed", file=sys.stderr)  # noqa: T201
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
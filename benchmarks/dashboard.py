@@ -0,0 +1,202 @@
+"""
+Benchmark the dashboard on synthetic libraries of increasing sizes.
+
+Run with `python -m benchmarks.dashboard`. For each size, a synthetic instance
+is generated (see `benchmarks.synthetic`), unless one already exists in the
+work directory. Then each step of the dashboard gets timed, from loading the
+items to rendering the page through the Flask test client, and the latency
+percentiles and peak memory usage of each step are reported.
+
+Results may be saved with `--save-baseline`, and later compared against with
+`--baseline`; the run fails if a median latency exceeds its baseline by more
+than the tolerance.
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from flask import render_template
+
+from kerkoapp import dashboard
+from kerkoapp.extra import parse_extra
+
+from .synthetic import build_instance, create_instance_app
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+DASHBOARD_URL = "/bibliography/dashboard"
+
+
+def percentile(sorted_values, p):
+    """Return the `p`th percentile of `sorted_values`, by the nearest-rank method."""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def measure(func, repeat, setup=None):
+    """Return the timings (in seconds) and the peak memory (in bytes) of `func`."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+
+    # Tracing slows things down, hence a separate run for the memory usage.
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return sorted(timings), peak
+
+
+def get_cases(app, client):
+    """Return the steps to time, as (name, function, setup) tuples."""
+    items = dashboard.get_whoosh_items()
+    extras = [item["data"].get("extra", "") for item in items]
+
+    def string_to_dict_all():
+        for extra in extras:
+            dashboard.string_to_dict(extra)
+
+    def render():
+        response = client.get(DASHBOARD_URL)
+        if response.status_code != 200:  # noqa: PLR2004
+            msg = f"{DASHBOARD_URL} returned status {response.status_code}"
+            raise RuntimeError(msg)
+
+    def clear_dashboard_cache():
+        dashboard.dashboard_cache.clear()
+
+    stats = dashboard.get_dashboard_stats()
+    context = dashboard.get_dashboard_context(stats)
+
+    def render_template_only():
+        render_template("dashboard.html.jinja2", **context, rss_feed_url="")
+
+    # Render once to open the searchers and compile the templates.
+    app.jinja_env.get_template("dashboard.html.jinja2")
+    render()
+
+    return [
+        ("get_whoosh_items", dashboard.get_whoosh_items, None),
+        ("process_for_dashboard", lambda: dashboard.process_for_dashboard(items), None),
+        ("string_to_dict (cold)", string_to_dict_all, parse_extra.cache_clear),
+        ("string_to_dict (warm)", string_to_dict_all, None),
+        ("get_item_type_counts", lambda: dashboard.get_item_type_counts(items), None),
+        ("get_indexed_year_counts", dashboard.get_indexed_year_counts, None),
+        ("get_indexed_item_type_counts", dashboard.get_indexed_item_type_counts, None),
+        ("query_top_cited", dashboard.query_top_cited, None),
+        ("compute_dashboard_stats", lambda: dashboard.compute_dashboard_stats(items), None),
+        ("get_live_dashboard_stats", dashboard.get_live_dashboard_stats, None),
+        ("get_dashboard_context", lambda: dashboard.get_dashboard_context(stats), None),
+        ("render_template", render_template_only, None),
+        ("render (uncached)", render, clear_dashboard_cache),
+        ("render (cached)", render, None),
+    ]
+
+
+def run_size(instance_path, size, repeat):
+    if not (instance_path / "config.toml").exists():
+        print(f"Generating {size} items in '{instance_path}'...")  # noqa: T201
+        build_instance(instance_path, size)
+    app = create_instance_app(instance_path)
+    results = {}
+    with app.test_request_context():
+        client = app.test_client()
+        for name, func, setup in get_cases(app, client):
+            timings, peak = measure(func, repeat, setup)
+            results[name] = {
+                "p50": percentile(timings, 50),
+                "p95": percentile(timings, 95),
+                "p99": percentile(timings, 99),
+                "peak_kib": peak / 1024,
+            }
+    return results
+
+
+def print_results(size, results):
+    print(f"\n{size} items:")  # noqa: T201
+    print(  # noqa: T201
+        f"  {'step':<32} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KiB':>11}"
+    )
+    for name, r in results.items():
+        print(  # noqa: T201
+            f"  {name:<32} {r['p50'] * 1000:10.3f} {r['p95'] * 1000:10.3f}"
+            f" {r['p99'] * 1000:10.3f} {r['peak_kib']:11.1f}"
+        )
+
+
+def compare(results, baseline, tolerance):
+    """Return the steps whose median latency regressed beyond `tolerance`."""
+    failures = []
+    for size, size_results in results.items():
+        for name, r in size_results.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None or reference["p50"] <= 0:
+                continue
+            ratio = r["p50"] / reference["p50"]
+            if ratio > 1 + tolerance:
+                failures.append(f"{name} at {size} items is x{ratio:.2f} slower than baseline")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"Comma-separated numbers of items (default: {DEFAULT_SIZES}).",
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--workdir",
+        help="Directory where to keep the synthetic instances, for reuse across runs "
+        "(default: a temporary directory).",
+    )
+    parser.add_argument("--baseline", help="JSON file of results to compare against.")
+    parser.add_argument("--save-baseline", help="JSON file where to save the results.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Accepted relative slowdown of median latencies (default: 0.25).",
+    )
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    with contextlib.ExitStack() as stack:
+        if args.workdir:
+            workdir = Path(args.workdir)
+        else:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        results = {}
+        for size in sizes:
+            results[str(size)] = run_size(workdir / f"items-{size}", size, args.repeat)
+            print_results(size, results[str(size)])
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2))
+    failures = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        failures = compare(results, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)  # noqa: T201
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark the streaming export against building the whole export in memory.
+
+Run with `python -m benchmarks.export`. On synthetic instances (see
+`benchmarks.synthetic`) of increasing sizes, the CSV and NDJSON exports of
+`kerkoapp.export` get timed and their peak memory traced, and so does the
+baseline of processing every item into a list before writing it out, i.e., what
+an export built on `dashboard.process_for_dashboard` would do. The peak memory
+of the streaming export should stay flat as the library grows.
+"""
+
+import argparse
+import contextlib
+import sys
+import tempfile
+from pathlib import Path
+
+from kerkoapp.dashboard import get_whoosh_items, process_for_dashboard
+from kerkoapp.export import iter_export
+from kerkoapp.json_responses import dumps
+
+from .dashboard import measure, percentile
+from .synthetic import build_instance, create_instance_app
+
+DEFAULT_SIZES = "1000,10000"
+
+
+def consume(chunks):
+    for _chunk in chunks:
+        pass
+
+
+def build_in_memory():
+    items = process_for_dashboard(get_whoosh_items())
+    return b"".join(dumps(item) + b"\n" for item in items)
+
+
+def run_size(instance_path, size, repeat):
+    if not (instance_path / "config.toml").exists():
+        print(f"Generating {size} items in '{instance_path}'...")  # noqa: T201
+        build_instance(instance_path, size)
+    app = create_instance_app(instance_path)
+    cases = {
+        "csv": lambda: consume(iter_export("csv")),
+        "ndjson": lambda: consume(iter_export("ndjson")),
+        "in-memory": build_in_memory,
+    }
+    results = {}
+    with app.test_request_context():
+        for name, func in cases.items():
+            timings, peak = measure(func, repeat)
+            results[name] = (percentile(timings, 50), peak / 1024)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"Comma-separated numbers of items (default: {DEFAULT_SIZES}).",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case.")
+    parser.add_argument(
+        "--workdir",
+        help="Directory where to keep the synthetic instances, for reuse across runs "
+        "(default: a temporary directory).",
+    )
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.workdir:
+            workdir = Path(args.workdir)
+        else:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        print(f"\n  {'items':>7} {'case':<10} {'p50 s':>9} {'peak KiB':>10}")  # noqa: T201
+        for size in (int(n) for n in args.sizes.split(",")):
+            instance_path = (workdir / f"items-{size}").resolve()
+            for name, (p50, peak_kib) in run_size(instance_path, size, args.repeat).items():
+                print(f"  {size:>7} {name:<10} {p50:>9.3f} {peak_kib:>10.0f}")  # noqa: T201
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Benchmark the parser of the Zotero `extra` field on pathological inputs.
+
+Run with `python -m benchmarks.extra`. For each kind of input, the parser is
+timed on blobs of doubling sizes. Linear behavior means the time roughly
+doubles along with the size; the run fails if it grows much faster than that,
+or if any of the `VALUES` gets parsed wrong.
+The regular expression that `kerkoapp.dashboard.string_to_dict` used to rely
+on is timed too, for reference.
+"""
+
+import argparse
+import re
+import sys
+import timeit
+
+from kerkoapp.extra import parse_extra
+
+# The former pattern, kept only for comparison.
+LEGACY_PATTERN = re.compile(r"([^:]+):\s*([^,]+(?:https?://[^\s,]+)?)\s*(?:,|\s*$)")
+
+# Largest accepted time ratio between two successive (doubled) input sizes.
+MAX_GROWTH = 3.0
+
+INPUTS = {
+    # No colon at all: the legacy pattern retries from every position.
+    "no-colon": lambda n: "x" * n,
+    # A single pair whose value is made of colons.
+    "colons": lambda n: "k:" * (n // 2),
+    # A realistic pair, repeated.
+    "pairs": lambda n: ("CitedBy: 12, Cites: 40, OpenAlex: https://openalex.org/W1, " * n)[:n],
+    # One very long URL value.
+    "long-url": lambda n: "OALink: https://example.org/" + "a" * n,
+    # Digits that `str.isdigit()` accepts but `int()` rejects.
+    "superscripts": lambda n: ("CitedBy: \u00b2, Cites: \u00b9\u00b2, " * n)[:n],
+}
+
+# Expected (cited_by, cites) of inputs written by hand in Zotero.
+VALUES = {
+    "CitedBy: 12, Cites: 40": (12, 40),
+    "CitedBy: \u00b2, Cites: 3": (None, 3),
+    "CitedBy: \u2460": (None, None),
+    "CitedBy: 1.5, Cites: -2": (None, None),
+}
+
+
+def best_time(func, text, repeat):
+    return min(timeit.repeat(lambda: func(text), number=1, repeat=repeat))
+
+
+def parse_uncached(text):
+    return parse_extra.__wrapped__(text)
+
+
+def legacy_parse(text):
+    return LEGACY_PATTERN.findall(text)
+
+
+def check_values():
+    failures = []
+    for text, expected in VALUES.items():
+        extra = parse_uncached(text)
+        if (extra.cited_by, extra.cites) != expected:
+            failures.append(f"{text!r} parsed as {(extra.cited_by, extra.cites)}")
+    return failures
+
+
+def run(sizes, repeat, legacy):
+    failures = check_values()
+    for name, make_input in INPUTS.items():
+        print(f"{name}:")  # noqa: T201
+        previous = None
+        for size in sizes:
+            text = make_input(size)
+            elapsed = best_time(parse_uncached, text, repeat)
+            line = f"  {size:>9} chars  parse_extra {elapsed * 1000:9.3f} ms"
+            if previous:
+                growth = elapsed / previous if previous > 0 else 0
+                line += f"  (x{growth:.2f})"
+                if growth > MAX_GROWTH:
+                    failures.append(f"{name} at {size} chars grew x{growth:.2f}")
+            if legacy:
+                line += f"  legacy regex {best_time(legacy_parse, text, 1) * 1000:9.3f} ms"
+            print(line)  # noqa: T201
+            previous = elapsed
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--min-size", type=int, default=10_000)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="Also time the former regular expression (slow on large inputs).",
+    )
+    args = parser.parse_args()
+
+    sizes = [args.min_size * 2**i for i in range(args.steps)]
+    failures = run(sizes, args.repeat, args.legacy)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)  # noqa: T201
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
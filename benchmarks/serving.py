@@ -0,0 +1,238 @@
+"""
+Benchmark the WSGI and ASGI serving modes side by side, under many connections.
+
+Run with `python -m benchmarks.serving`. On a synthetic instance (see
+`benchmarks.synthetic`), each server gets started in turn, then loaded by
+keep-alive connections that request the landing page and the dashboard's
+statistics in a loop, for a number of connections that increases from run to
+run. The throughput, latency percentiles and errors get reported, by server and
+number of connections.
+
+The servers are gunicorn, with the sync workers and threads of the Docker
+image's command, serving `wsgi:app`, and uvicorn serving `asgi:app`. A server
+that is not installed gets skipped. The load comes from a single asyncio
+process, which may itself become the bottleneck at the highest counts.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .dashboard import percentile
+from .synthetic import build_instance
+
+DEFAULT_SIZE = 1000
+
+DEFAULT_CONNECTIONS = "64,256,1024"
+
+DEFAULT_URLS = (
+    "/",
+    "/bibliography/dashboard",
+    "/bibliography/dashboard/api/totals",
+    "/bibliography/dashboard/api/years",
+)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def get_server_commands(port, workers):
+    """Return the commands that start each server, by name."""
+    return {
+        "gunicorn": [
+            sys.executable, "-m", "gunicorn",
+            "--workers", str(workers),
+            "--threads", "4",
+            "--keep-alive", "5",
+            "--log-level", "warning",
+            "--bind", f"127.0.0.1:{port}",
+            "wsgi:app",
+        ],
+        "uvicorn": [
+            sys.executable, "-m", "uvicorn",
+            "--workers", str(workers),
+            "--log-level", "warning",
+            "--no-access-log",
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "asgi:app",
+        ],
+    }  # fmt: skip
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_server(command, env, port, timeout=60.0):
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env)
+    try:
+        deadline = time.monotonic() + timeout
+        while asyncio.run(probe(port)) != 200:  # noqa: PLR2004
+            if process.poll() is not None or time.monotonic() > deadline:
+                msg = f"Server did not start: {' '.join(command)}"
+                raise RuntimeError(msg)
+            time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def probe(port):
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return None
+    try:
+        return (await fetch(reader, writer, "/"))[0]
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        return None
+    finally:
+        writer.close()
+
+
+async def fetch(reader, writer, path):
+    """Send a GET request, and return the status and whether the server closes the connection."""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers.get("connection") == "close"
+
+
+async def load(port, connections, duration, urls):
+    """Return the latencies of the successful requests, and the number of errors."""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def connection_loop(offset):
+        nonlocal errors
+        reader = writer = None
+        n = offset
+        while time.monotonic() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                start_time = time.perf_counter()
+                status, close = await fetch(reader, writer, urls[n % len(urls)])
+                n += 1
+                if status == 200:  # noqa: PLR2004
+                    latencies.append(time.perf_counter() - start_time)
+                else:
+                    errors += 1
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                close = True
+                await asyncio.sleep(0.01)
+            if close and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(connection_loop(i) for i in range(connections)))
+    return latencies, errors
+
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Number of items.")
+    parser.add_argument(
+        "--connections",
+        default=DEFAULT_CONNECTIONS,
+        help=f"Comma-separated numbers of connections (default: {DEFAULT_CONNECTIONS}).",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run.")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes per server.")
+    parser.add_argument("--url", action="append", help="URL to request (repeatable).")
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="Disable the HTTP cache of pages, unlike in production.",
+    )
+    parser.add_argument(
+        "--workdir",
+        help="Directory where to keep the synthetic instance, for reuse across runs "
+        "(default: a temporary directory).",
+    )
+    args = parser.parse_args()
+    connection_counts = [int(n) for n in args.connections.split(",")]
+    urls = args.url or list(DEFAULT_URLS)
+    raise_file_limit()
+
+    with contextlib.ExitStack() as stack:
+        if args.workdir:
+            workdir = Path(args.workdir)
+        else:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        instance_path = (workdir / f"items-{args.size}").resolve()
+        if not (instance_path / "config.toml").exists():
+            print(f"Generating {args.size} items in '{instance_path}'...")  # noqa: T201
+            build_instance(instance_path, args.size)
+        env = {
+            **os.environ,
+            "KERKOAPP_INSTANCE_PATH": str(instance_path),
+            "KERKOAPP_CONFIG_FILES": str(instance_path / "config.toml"),
+            "KERKOAPP_kerkoapp__http_cache__enabled": "false" if args.no_http_cache else "true",
+        }
+
+        print(  # noqa: T201
+            f"\n  {'server':<10} {'conns':>6} {'req/s':>9} "
+            f"{'p50 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        port = get_free_port()
+        for name, command in get_server_commands(port, args.workers).items():
+            if importlib.util.find_spec(name) is None:
+                print(f"  {name:<10} not installed, skipped")  # noqa: T201
+                continue
+            with run_server(command, env, port):
+                for connections in connection_counts:
+                    latencies, errors = asyncio.run(load(port, connections, args.duration, urls))
+                    latencies.sort()
+                    p50 = percentile(latencies, 50) * 1000 if latencies else 0
+                    p99 = percentile(latencies, 99) * 1000 if latencies else 0
+                    print(  # noqa: T201
+                        f"  {name:<10} {connections:>6} {len(latencies) / args.duration:>9.0f} "
+                        f"{p50:>9.1f} {p99:>9.1f} {errors:>7}"
+                    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
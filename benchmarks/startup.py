@@ -0,0 +1,152 @@
+"""
+Benchmark the start of a KerkoApp worker process.
+
+Run with `python -m benchmarks.startup`. Each run starts a fresh Python process
+on a synthetic instance (see `benchmarks.synthetic`), and times importing
+`kerkoapp`, creating the app, and serving the first dashboard request. The peak
+memory (RSS) of the process is reported too.
+
+Runs alternate between a cold configuration cache, i.e., deleted before the
+process starts, and a warm one. With `--budget`, the run fails if the median
+time to a created app (import plus `create_app()`) with a warm cache exceeds
+the given number of milliseconds.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from .dashboard import percentile
+from .synthetic import build_instance
+
+DEFAULT_SIZE = 1000
+
+DASHBOARD_URL = "/bibliography/dashboard"
+
+# Code run by each worker process, printing its timings as JSON.
+WORKER_CODE = f"""
+import json, resource, sys, time
+
+start_time = time.perf_counter()
+import kerkoapp
+imported_time = time.perf_counter()
+app = kerkoapp.create_app()
+created_time = time.perf_counter()
+response = app.test_client().get({DASHBOARD_URL!r})
+response.close()
+served_time = time.perf_counter()
+if response.status_code != 200:
+    sys.exit(f"{DASHBOARD_URL} returned status {{response.status_code}}")
+print(json.dumps({{
+    "import": imported_time - start_time,
+    "create_app": created_time - imported_time,
+    "first_request": served_time - created_time,
+    "total": served_time - start_time,
+    "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+"""
+
+PHASES = ("import", "create_app", "first_request", "total")
+
+
+def run_worker(instance_path):
+    env = {
+        **os.environ,
+        "KERKOAPP_INSTANCE_PATH": str(instance_path),
+        "KERKOAPP_CONFIG_FILES": str(instance_path / "config.toml"),
+    }
+    completed = subprocess.run(
+        [sys.executable, "-c", WORKER_CODE],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode != 0:
+        msg = f"Worker failed:\n{completed.stderr}"
+        raise RuntimeError(msg)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(instance_path, repeat):
+    """Return the timings of each phase, by configuration cache state."""
+    from kerkoapp.config_helpers import get_config_cache_path
+
+    cache_path = get_config_cache_path(SimpleNamespace(instance_path=instance_path))
+    results = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        cache_path.unlink(missing_ok=True)
+        results["cold"].append(run_worker(instance_path))
+        results["warm"].append(run_worker(instance_path))
+    return results
+
+
+def summarize(runs):
+    summary = {}
+    for phase in PHASES:
+        timings = sorted(r[phase] for r in runs)
+        summary[phase] = {"p50": percentile(timings, 50), "p95": percentile(timings, 95)}
+    summary["max_rss_kib"] = max(r["max_rss_kib"] for r in runs)
+    return summary
+
+
+def print_summary(cache_state, summary):
+    print(f"\n{cache_state} configuration cache:")  # noqa: T201
+    print(f"  {'phase':<16} {'p50 ms':>10} {'p95 ms':>10}")  # noqa: T201
+    for phase in PHASES:
+        s = summary[phase]
+        print(f"  {phase:<16} {s['p50'] * 1000:10.1f} {s['p95'] * 1000:10.1f}")  # noqa: T201
+    print(f"  {'peak RSS KiB':<16} {summary['max_rss_kib']:10d}")  # noqa: T201
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Number of items.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--workdir",
+        help="Directory where to keep the synthetic instance, for reuse across runs "
+        "(default: a temporary directory).",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        help="Maximum median time to a created app with a warm cache, in milliseconds.",
+    )
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.workdir:
+            workdir = Path(args.workdir)
+        else:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        instance_path = (workdir / f"items-{args.size}").resolve()
+        if not (instance_path / "config.toml").exists():
+            print(f"Generating {args.size} items in '{instance_path}'...")  # noqa: T201
+            build_instance(instance_path, args.size)
+        results = run(instance_path, args.repeat)
+
+    summaries = {state: summarize(runs) for state, runs in results.items()}
+    for state, summary in summaries.items():
+        print_summary(state, summary)
+
+    if args.budget is not None:
+        warm = sorted(r["import"] + r["create_app"] for r in results["warm"])
+        elapsed = percentile(warm, 50) * 1000
+        if elapsed > args.budget:
+            print(  # noqa: T201
+                f"FAIL: app created in {elapsed:.1f} ms, over the {args.budget:.1f} ms budget",
+                file=sys.stderr,
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
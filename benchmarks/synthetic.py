@@ -0,0 +1,253 @@
+"""
+Generate synthetic KerkoApp instances, with Kerko-shaped Whoosh indexes.
+
+The items mimic those returned by the Zotero API, with realistic `creators`
+lists and `extra` citation strings, so that the cache, the search index and
+the dashboard snapshot built from them behave like the real ones.
+
+Run with `python -m benchmarks.synthetic DIRECTORY --size 10000` to generate an
+instance that can then be reused by the other benchmarks.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from kerko.sync.zotero import Collections, LibraryContext
+
+ITEM_TYPES = {
+    # Item type: (weight, localized name).
+    "journalArticle": (50, "Journal Article"),
+    "book": (10, "Book"),
+    "bookSection": (12, "Book Section"),
+    "conferencePaper": (15, "Conference Paper"),
+    "thesis": (3, "Thesis"),
+    "report": (5, "Report"),
+    "presentation": (5, "Presentation"),
+}
+
+ITEM_FIELDS = ["title", "date", "DOI", "url", "extra", "abstractNote", "publicationTitle"]
+
+FIRST_NAMES = ["Ana", "Ben", "Chen", "Dana", "Emeka", "Fatima", "Giulia", "Hiro", "Ines", "Jamal"]
+LAST_NAMES = ["Nguyen", "Smith", "Kowalski", "Okafor", "Rossi", "Haddad", "Tanaka", "Silva"]
+
+WORDS = [
+    "analysis",
+    "assessment",
+    "community",
+    "connecticut",
+    "data",
+    "design",
+    "education",
+    "effects",
+    "evidence",
+    "framework",
+    "health",
+    "impact",
+    "learning",
+    "model",
+    "network",
+    "outcomes",
+    "policy",
+    "practice",
+    "quality",
+    "research",
+    "review",
+    "river",
+    "social",
+    "students",
+    "study",
+    "survey",
+    "systems",
+    "teaching",
+    "theory",
+    "urban",
+]
+
+CONFIG_TEMPLATE = """\
+SECRET_KEY = "synthetic-benchmark-secret-key"
+ZOTERO_API_KEY = "synthetic-benchmark-api-key"
+ZOTERO_LIBRARY_ID = "0000000"
+ZOTERO_LIBRARY_TYPE = "group"
+
+[kerkoapp.http_cache]
+enabled = false
+"""
+
+
+def make_collections():
+    """
+    Return Kerko's `Collections` for a library without collections.
+
+    The object gets pickled into the library context, so it must be of a class
+    that `flask kerko sync index` can import, unlike a class of this module
+    when run as `__main__`. Its constructor would request Zotero, hence the
+    bypass.
+    """
+    collections = Collections.__new__(Collections)
+    collections.collections = {}
+    collections.iterator = None
+    return collections
+
+
+def make_extra(rng, n):
+    """Return an `extra` field value, in the shapes found in the library."""
+    kind = rng.random()
+    if kind < 0.6:  # noqa: PLR2004
+        return (
+            f"CitedBy: {int(rng.paretovariate(1.2)) - 1}, Cites: {rng.randint(0, 80)}, "
+            f"OpenAlex: https://openalex.org/W{1000000 + n}, "
+            f"OpenAccess: {rng.choice(['true', 'false'])}"
+        )
+    if kind < 0.7:  # noqa: PLR2004
+        return f"Citation Key Alias: https://lens.org/{n:09d}\nPMID: {rng.randint(1, 10**8)}"
+    if kind < 0.8:  # noqa: PLR2004
+        return f"PMID: {rng.randint(1, 10**8)}"
+    return ""
+
+
+def make_date(rng):
+    """Return a (Zotero date, parsed date) tuple."""
+    year = rng.randint(1964, 2025)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    kind = rng.random()
+    if kind < 0.5:  # noqa: PLR2004
+        return f"{year}-{month:02d}-{day:02d}", f"{year}-{month:02d}-{day:02d}"
+    if kind < 0.8:  # noqa: PLR2004
+        return f"{month}/{year}", f"{year}-{month:02d}"
+    return str(year), str(year)
+
+
+def make_item(rng, n):
+    """Return a synthetic item, shaped like those of the Zotero API."""
+    key = f"S{n:07d}"
+    item_type = rng.choices(list(ITEM_TYPES), weights=[w for w, _ in ITEM_TYPES.values()])[0]
+    date, parsed_date = make_date(rng)
+    creators = [
+        {
+            "creatorType": "author",
+            "firstName": rng.choice(FIRST_NAMES),
+            "lastName": rng.choice(LAST_NAMES),
+        }
+        for _ in range(max(1, min(12, int(rng.expovariate(0.4)))))
+    ]
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))).capitalize()
+    added = time.gmtime(1262304000 + n * 3600)  # One item per hour since 2010.
+    return {
+        "key": key,
+        "version": n + 1,
+        "library": {"type": "group", "id": 0, "name": "Synthetic"},
+        "links": {},
+        "meta": {
+            "creatorSummary": creators[0]["lastName"],
+            "parsedDate": parsed_date,
+            "numChildren": 0,
+        },
+        "data": {
+            "key": key,
+            "version": n + 1,
+            "itemType": item_type,
+            "title": title,
+            "creators": creators,
+            "abstractNote": " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 120))),
+            "publicationTitle": "Journal of " + rng.choice(WORDS).capitalize(),
+            "date": date,
+            "DOI": f"10.5555/synthetic.{n}" if rng.random() < 0.7 else "",  # noqa: PLR2004
+            "url": f"https://example.org/items/{n}" if rng.random() < 0.5 else "",  # noqa: PLR2004
+            "extra": make_extra(rng, n),
+            "tags": [],
+            "collections": [],
+            "relations": {},
+            "dateAdded": time.strftime("%Y-%m-%dT%H:%M:%SZ", added),
+            "dateModified": time.strftime("%Y-%m-%dT%H:%M:%SZ", added),
+        },
+    }
+
+
+def make_library_context():
+    item_types = {t: label for t, (_weight, label) in ITEM_TYPES.items()}
+    return LibraryContext(
+        "0000000",
+        "group",
+        collections=make_collections(),
+        item_types=item_types,
+        item_fields={t: [{"field": f, "localized": f} for f in ITEM_FIELDS] for t in item_types},
+        creator_types={t: [{"creatorType": "author", "localized": "Author"}] for t in item_types},
+    )
+
+
+def create_instance_app(instance_path):
+    """Return a KerkoApp app for the synthetic instance at `instance_path`."""
+    instance_path = Path(instance_path).resolve()
+    os.environ["KERKOAPP_INSTANCE_PATH"] = str(instance_path)
+    os.environ["KERKOAPP_CONFIG_FILES"] = str(instance_path / "config.toml")
+
+    from kerkoapp import create_app
+
+    return create_app()
+
+
+def build_instance(instance_path, size, seed=0):
+    """
+    Generate a synthetic instance of `size` items at `instance_path`.
+
+    This writes a config file, the Kerko cache, the search index (using Kerko's
+    own index sync), the dashboard snapshot and the author statistics.
+    """
+    from kerko.storage import open_index, save_object
+    from kerko.sync.cache import get_cache_schema
+    from kerko.sync.index import sync_index
+
+    from kerkoapp.authors import update_authors
+    from kerkoapp.dashboard import build_snapshot
+
+    instance_path = Path(instance_path).resolve()
+    instance_path.mkdir(parents=True, exist_ok=True)
+    (instance_path / "config.toml").write_text(CONFIG_TEMPLATE)
+    app = create_instance_app(instance_path)
+
+    rng = random.Random(seed)
+    with app.app_context():
+        cache = open_index("cache", schema=get_cache_schema, auto_create=True, write=True)
+        writer = cache.writer(limitmb=256)
+        for n in range(size):
+            item = make_item(rng, n)
+            writer.add_document(
+                key=item["key"],
+                version=item["version"],
+                parentItem="",
+                itemType=item["data"]["itemType"],
+                library=item["library"],
+                links=item["links"],
+                meta=item["meta"],
+                data=item["data"],
+            )
+        writer.commit()
+        save_object("cache", "version", size)
+        save_object("cache", "library", make_library_context())
+        sync_index()
+        build_snapshot()
+        update_authors()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("directory", help="Instance directory to create.")
+    parser.add_argument("--size", type=int, default=1000, help="Number of items.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    build_instance(args.directory, args.size, args.seed)
+    elapsed = time.perf_counter() - start_time
+    print(f"Built {args.size} items in '{args.directory}' in {elapsed:.1f} s.")  # noqa: T201
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Gunicorn server hooks for KerkoApp.
+
+Gunicorn loads this file from its working directory, e.g., in the Docker
+image. Command line options, and options from the `GUNICORN_CMD_ARGS`
+environment variable, take precedence over the settings below.
+
+Preload mode is off by default. Turn it on with `--preload`, e.g., with
+`GUNICORN_CMD_ARGS="--preload"`. The app then gets created once, in the master
+process, and warmed up before the workers get forked: the configuration,
+Composer, compiled templates and snapshots end up shared by all workers, which
+lowers the memory used by each of them. Each worker still opens its own Whoosh
+searchers, and starts its own background threads, after the fork (see
+`kerkoapp.preload`).
+
+With preload mode, a `HUP` signal restarts the workers without loading the app
+again. Restart gunicorn itself to apply changes to the code or configuration.
+"""
+
+
+def when_ready(server):
+    # Called in the master process, after the app is preloaded and before any
+    # worker gets forked.
+    if server.cfg.preload_app:
+        from kerkoapp.preload import freeze, warm_up
+
+        warm_up(server.app.wsgi())
+        freeze()
+
+
+def post_worker_init(worker):
+    # Without preload mode, each worker warms up its own app before serving.
+    if not worker.cfg.preload_app:
+        from kerkoapp.preload import warm_up
+
+        warm_up(worker.wsgi)
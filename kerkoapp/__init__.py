@@ -5,19 +5,29 @@ A sample Flask application using the Kerko blueprint.
 import os
 import sys
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
 import logging as py_logging
 
 import kerko
 from flask import Flask, render_template
-from kerko.storage import get_doc_count
 from flask_babel import get_locale
-from kerko.config_helpers import config_update, parse_config
+from jinja2 import FileSystemBytecodeCache
+from kerko.config_helpers import config_get, config_update, parse_config
 
-from . import logging
+from . import assets, cli, http_caching, logging, metrics, profiling, search_cache
+from .caching import BackgroundRefreshCache, get_index_version
+from .citations import add_citation_fields
 from .dashboard import dashboard_bp
-from .config_helpers import KerkoAppModel, load_config_files
-from .extensions import babel, bootstrap
+from .export import export_bp
+from .config_helpers import (
+    KerkoAppModel,
+    get_config_cache_key,
+    kerkoapp_config,
+    load_cached_config,
+    load_config_files,
+    save_cached_config,
+)
+from .extensions import babel, bootstrap, indexes
+from .indexes import get_whoosh_dir
 
 
 
@@ -33,21 +43,32 @@ def create_app() -> Flask:
         msg = f"Unable to initialize the application. {e}"
         raise RuntimeError(msg) from e
 
-    # Initialize app configuration with Kerko's defaults.
-    config_update(app.config, kerko.DEFAULTS)
+    # Reuse the configuration parsed at a previous start, unless any of the
+    # configuration files or environment variables has changed since.
+    config_files = os.environ.get("KERKOAPP_CONFIG_FILES")
+    config_cache_key = get_config_cache_key(app, config_files, "KERKOAPP")
+    if not load_cached_config(app, config_cache_key):
+        # Initialize app configuration with Kerko's defaults.
+        config_update(app.config, kerko.DEFAULTS)
 
-    # Update app configuration from TOML configuration file(s).
-    load_config_files(app, os.environ.get("KERKOAPP_CONFIG_FILES"))
+        # Serve Bootstrap from the files bundled with Bootstrap-Flask rather
+        # than from a CDN, unless the configuration says otherwise.
+        app.config["BOOTSTRAP_SERVE_LOCAL"] = True
 
-    # Update app configuration from environment variables.
-    app.config.from_prefixed_env(prefix="KERKOAPP")
+        # Update app configuration from TOML configuration file(s).
+        load_config_files(app, config_files)
 
-    # Validate configuration and save its parsed version.
-    parse_config(app.config)
+        # Update app configuration from environment variables.
+        app.config.from_prefixed_env(prefix="KERKOAPP")
 
-    # Validate extra configuration model and save its parsed version.
-    if app.config.get("kerkoapp"):
-        parse_config(app.config, "kerkoapp", KerkoAppModel)
+        # Validate configuration and save its parsed version.
+        parse_config(app.config)
+
+        # Validate extra configuration model and save its parsed version.
+        if app.config.get("kerkoapp"):
+            parse_config(app.config, "kerkoapp", KerkoAppModel)
+
+        save_cached_config(app, config_cache_key)
 
     # Initialize the Composer object.
     app.config["kerko_composer"] = kerko.composer.Composer(app.config)
@@ -57,50 +78,99 @@ def create_app() -> Flask:
     # good place to alter the Composer object, perhaps adding facets.
     # ----
 
+    # Index the citation counts recorded in the items' `extra` field.
+    add_citation_fields(app.config["kerko_composer"])
+
     # Configure file logging
     configure_file_logging(app)
+    configure_templates(app)
 
     #Helper functions for KerkoApp
     register_extensions(app)
     register_blueprints(app)
     register_errorhandlers(app)
     register_routes(app)
+    register_commands(app)
     return app
 
 
+def apply_proxy_fix(app: Flask) -> None:
+    """
+    Trust the `X-Forwarded-*` headers set by a reverse proxy, if configured.
+
+    This is left to the entry modules, `wsgi.py` and `asgi.py`, since it only
+    concerns requests coming from a server.
+    """
+    try:
+        proxy_fix_config = config_get(app.config, "kerkoapp.proxy_fix")
+    except KeyError:
+        return
+    if proxy_fix_config and proxy_fix_config.get("enabled"):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app,
+            **{kwarg: value for kwarg, value in proxy_fix_config.items() if kwarg != "enabled"},
+        )
+        # For `kerkoapp.asgi` to see requests as the app does before running it
+        app.extensions["kerkoapp_proxy_fix"] = app.wsgi_app
+
+
 def configure_file_logging(app: Flask) -> None:
     """
     Configure logging to write console output to a file.
     Logs go to instance/logs/app.log with rotation.
+
+    Records get written by a background thread, see `kerkoapp.logging`. The
+    log file may be shared by several processes, e.g., gunicorn workers.
     """
+    settings = kerkoapp_config(app).logging
     log_dir = Path(app.instance_path) / "logs"
     log_dir.mkdir(parents=True, exist_ok=True)
     log_file = log_dir / "app.log"
-    
+    formatter = py_logging.Formatter('[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+
     # Create rotating file handler
-    file_handler = RotatingFileHandler(
+    file_handler = logging.SharedRotatingFileHandler(
         log_file,
-        maxBytes=10_485_760,  # 10MB
-        backupCount=10
+        maxBytes=settings.max_bytes,
+        backupCount=settings.backup_count,
     )
-    file_handler.setFormatter(py_logging.Formatter(
-        '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
-    ))
+    file_handler.setFormatter(formatter)
     file_handler.setLevel(py_logging.INFO)
-    app.logger.addHandler(file_handler)
-    
+
     # Also add console output
     console_handler = py_logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(py_logging.Formatter(
-        '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
-    ))
+    console_handler.setFormatter(formatter)
     console_handler.setLevel(py_logging.INFO)
-    app.logger.addHandler(console_handler)
-    
+
+    # Replace the handlers of an app previously created in this process
+    for handler in list(app.logger.handlers):
+        if isinstance(handler, logging.AsyncLogHandler):
+            app.logger.removeHandler(handler)
+            handler.close()
+    app.logger.addHandler(logging.make_async(app, [file_handler, console_handler]))
+
     app.logger.setLevel(py_logging.INFO)
     app.logger.info('KerkoApp startup - logging configured')
 
 
+def configure_templates(app: Flask) -> None:
+    """
+    Keep compiled templates in instance/jinja-cache.
+
+    Each process still compiles a template only once, but then processes
+    started later, e.g., new gunicorn workers, load the compiled code instead
+    of parsing the template again. Jinja recompiles templates whose source
+    has changed.
+    """
+    if not kerkoapp_config(app).templates.bytecode_cache:
+        return
+    cache_dir = Path(app.instance_path) / "jinja-cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+
+
 def register_extensions(app: Flask) -> None:
     # Initialize Babel to use translations from both Kerko and the app. Config
     # parameters BABEL_DOMAIN and BABEL_TRANSLATION_DIRECTORIES may override
@@ -117,30 +187,62 @@ def register_extensions(app: Flask) -> None:
 
     logging.init_app(app)
     bootstrap.init_app(app)
+    indexes.init_app(app)
+    assets.init_app(app)
+    http_caching.init_app(app)
+    profiling.init_app(app)
+    metrics.init_app(app)
 
 def register_blueprints(app: Flask) -> None:
     # Setting `url_prefix` is required to distinguish the blueprint's static
     # folder route URL from the app's.
     app.register_blueprint(kerko.make_blueprint(), url_prefix="/bibliography")
+    # Serve Kerko's most requested search pages from memory.
+    search_cache.init_app(app)
     #DASHBOOARD BLUEPRINT (ROOT/SPLASHPAGE URL '/dashboard') WITH REDIRECT TO MAIN BIB
     app.register_blueprint(dashboard_bp, url_prefix="/bibliography")
+    app.register_blueprint(export_bp, url_prefix="/bibliography")
+
+
+def register_commands(app: Flask) -> None:
+    """Register KerkoApp's CLI commands, e.g., `flask kerkoapp snapshot`."""
+    cli.init_app(app)
 
 
 def register_routes(app: Flask) -> None:
     """Register app-level routes outside of blueprints."""
 
+    # The document count shown on the landing page, refreshed in the
+    # background so that the page never waits on the index.
+    doc_count_cache = BackgroundRefreshCache(
+        "doc-count",
+        ttl=60.0,
+        on_error=lambda e: app.logger.warning("Unable to refresh index document count: %s", e),
+    )
+    metrics.register_collector(metrics.cache_collector("doc_count", doc_count_cache))
+
+    def count_documents():
+        with app.app_context():
+            return indexes.doc_count(get_whoosh_dir("index"))
+
+    def get_total_count():
+        try:
+            return doc_count_cache.get(get_index_version(get_whoosh_dir("index")), count_documents)
+        except Exception as e:  # pragma: no cover - non-fatal display fallback
+            app.logger.warning(f"Unable to retrieve index document count: {e}")
+        return 0
+
     @app.route("/")
+    @http_caching.cached_page(get_total_count)
     def landing_page():
         """
         Render the site's landing page.
 
         Provides `total_count` to the template based on Kerko's index size.
+        While the index is unavailable, e.g., during a sync, the last known
+        count is provided.
         """
-        total_count = 0
-        try:
-            total_count = get_doc_count("index")
-        except Exception as e:  # pragma: no cover - non-fatal display fallback
-            app.logger.warning(f"Unable to retrieve index document count: {e}")
+        total_count = get_total_count()
         return render_template("landing.html.jinja2", total_count=total_count, title="SCSU Authors")
 
 
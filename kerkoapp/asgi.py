@@ -0,0 +1,226 @@
+"""
+Serve the app over ASGI, e.g., with uvicorn.
+
+`AsgiApp` bridges ASGI requests to the app's WSGI callable, i.e., through the
+same middlewares (ProxyFix, metrics, profiling) as under a WSGI server.
+Blocking work, i.e., Flask views reading the Whoosh indexes, runs in a pool of
+`threads` threads, sized by `[kerkoapp.asgi]`, while the event loop keeps
+accepting connections. Responses get streamed back to the client chunk by
+chunk, each chunk waiting for the previous one to be sent.
+
+Pages that `kerkoapp.http_caching` can answer without rendering, i.e., with a
+304 or from memory, typically the landing page and the dashboard's statistics,
+get served right from the event loop instead. Finding the answer, which reads
+the index directories, still takes a short trip through the thread pool, as the
+app would see the request, i.e., through ProxyFix. The page then gets served
+with that answer, even if it has gone stale in the meantime, so that no page
+ever renders in the event loop.
+"""
+
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, current_app, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from . import http_caching
+from .config_helpers import kerkoapp_config
+from .preload import warm_up
+
+
+class AsgiApp:
+    """ASGI application wrapping a Flask app."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.settings = kerkoapp_config(app).asgi
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._proxy_fix = None
+        proxy_fix = app.extensions.get("kerkoapp_proxy_fix")
+        if proxy_fix is not None:
+            # Same settings, but returning the rewritten environ
+            self._proxy_fix = ProxyFix(
+                return_environ,
+                x_for=proxy_fix.x_for,
+                x_proto=proxy_fix.x_proto,
+                x_host=proxy_fix.x_host,
+                x_port=proxy_fix.x_port,
+                x_prefix=proxy_fix.x_prefix,
+            )
+
+    @property
+    def executor(self):
+        # Created on first use, in the process that serves requests
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.settings.threads, thread_name_prefix="kerkoapp-asgi"
+                )
+            return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            environ = build_environ(scope, await read_body(receive))
+            answer = None
+            if self.settings.inline_cached_pages and environ["REQUEST_METHOD"] in ("GET", "HEAD"):
+                loop = asyncio.get_running_loop()
+                answer = await loop.run_in_executor(self.executor, self.find_cached_answer, environ)
+            if answer is not None:
+                environ[http_caching.CACHED_ANSWER_KEY] = answer
+                await self.run_inline(environ, send)
+            else:
+                await self.run_in_thread(environ, send)
+        else:
+            msg = f"Unsupported ASGI scope type '{scope['type']}'."
+            raise RuntimeError(msg)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Like gunicorn's workers do, see `gunicorn.conf.py`
+                warm_up(self.app)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._executor is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def find_cached_answer(self, environ):
+        """Return the answer `http_caching` has for the request, or `None`."""
+        # Only the URL and the request headers matter here, hence a copy of the
+        # environ, as ProxyFix would rewrite it, e.g., for the page keys to have
+        # the URL scheme and host of the client's request
+        environ = dict(environ)
+        if self._proxy_fix is not None:
+            environ = self._proxy_fix(environ, None)
+        with self.app.request_context(environ):
+            if request.routing_exception is not None:
+                return None
+            view = current_app.view_functions.get(request.endpoint)
+            return http_caching.find_cached_answer(view)
+
+    async def run_inline(self, environ, send):
+        response = []
+
+        def start_response(status, headers, exc_info=None):  # noqa: ARG001
+            response[:] = [status, headers]
+
+        body = self.app.wsgi_app(environ, start_response)
+        try:
+            chunks = [chunk for chunk in body if chunk]
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        await send(make_start_message(*response))
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def run_in_thread(self, environ, send):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.run_wsgi, environ, send, loop)
+
+    def run_wsgi(self, environ, send, loop):
+        """Run the WSGI app in the current thread, sending its response from the loop."""
+        response = []
+        started = False
+
+        def send_from_loop(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+        body = self.app.wsgi_app(environ, start_response)
+        try:
+            for chunk in body:
+                if not chunk:
+                    continue
+                if not started:
+                    send_from_loop(make_start_message(*response))
+                    started = True
+                send_from_loop({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                send_from_loop(make_start_message(*response))
+            send_from_loop({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+
+def return_environ(environ, start_response):  # noqa: ARG001
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def build_environ(scope, body):
+    """Return the WSGI environ of an ASGI HTTP request, as PEP 3333 defines it."""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode().decode("latin-1"),
+        "PATH_INFO": path.encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1")
+        value = raw_value.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        if key in environ:
+            separator = "; " if key == "HTTP_COOKIE" else ","
+            value = environ[key] + separator + value
+        environ[key] = value
+    return environ
+
+
+def make_start_message(status, headers):
+    return {
+        "type": "http.response.start",
+        "status": int(status.split(" ", 1)[0]),
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+        ],
+    }
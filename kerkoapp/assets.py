@@ -0,0 +1,206 @@
+"""
+Versioned static assets, served with far-future caching.
+
+The build step copies every file of `kerkoapp/static/` to
+`kerkoapp/static/build/`, with a hash of its content in its name, e.g.,
+`css/dashboard.3f2a9c1b0d4e.css`, along with gzip and, if the optional
+`brotli` package is installed, brotli variants of text files. A manifest maps
+each original path to its hashed name. Since a hashed file never changes, it
+gets served with an immutable `Cache-Control` header, and browsers never have
+to check it again.
+
+Third-party libraries get vendored under `kerkoapp/static/vendor/` by the
+build step, from the pinned URLs of `VENDORED`, so that pages need no CDN and
+the site may run on hosts without Internet access. A download whose SHA-256
+digest differs from the pinned one gets rejected, and makes the build fail.
+
+Run the build with `flask kerkoapp assets` or `python -m kerkoapp.assets`, the
+latter not needing any configuration, e.g., when building a Docker image.
+Templates get the URL of an asset with `asset_url('css/dashboard.css')`.
+Until the assets are built, that URL is the plain static one, or, for a
+library not vendored yet, its CDN URL.
+"""
+
+import hashlib
+import json
+import mimetypes
+import sys
+from pathlib import Path
+
+from flask import Blueprint, Flask, abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+STATIC_DIR = Path(__file__).parent / "static"
+
+BUILD_DIR = STATIC_DIR / "build"
+
+MANIFEST_FILENAME = "manifest.json"
+
+# Third-party libraries, by path under the static folder, as (URL, hex SHA-256
+# digest of the file) tuples. The digest is that of the subresource integrity
+# value that cdnjs publishes for the file.
+VENDORED = {
+    "vendor/chartjs/Chart.min.js": (
+        "https://cdnjs.cloudflare.com/ajax/libs/Chart.js/2.8.0/Chart.min.js",
+        "52ff41341b9cbc23e2a4a436352f706292668bc0d33847d303f9c7d9aa0900bc",
+    ),
+}
+
+# Files worth compressing.
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".json", ".map", ".svg", ".txt"}
+
+# One year, the longest lifetime that caches are expected to honor.
+IMMUTABLE_MAX_AGE = 31_536_000
+
+assets_bp = Blueprint("assets", __name__)
+
+
+def fetch_vendored(static_dir=STATIC_DIR):
+    """
+    Download the third-party libraries missing from the static folder.
+
+    Return the outcome of each download, by path: `None` if successful, else
+    the error. A file whose digest differs from the pinned one is not written.
+    """
+    # Only needed by the build step, not worth slowing down the app's start
+    import urllib.request
+
+    outcomes = {}
+    for filename, (url, sha256) in VENDORED.items():
+        path = static_dir / filename
+        if path.exists():
+            continue
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                content = response.read()
+        except OSError as e:
+            outcomes[filename] = e
+            continue
+        digest = hashlib.sha256(content).hexdigest()
+        if digest != sha256:
+            outcomes[filename] = ValueError(
+                f"SHA-256 digest {digest} does not match the pinned {sha256}"
+            )
+            continue
+        write_file(path, content)
+        outcomes[filename] = None
+    return outcomes
+
+
+def hashed_name(filename, content):
+    path = Path(filename)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    # Keep compound suffixes last, e.g., `Chart.min.<hash>.js`
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+def write_file(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(content)
+    tmp_path.replace(path)
+
+
+def build_assets(static_dir=STATIC_DIR, build_dir=BUILD_DIR):
+    """
+    Write the hashed copies of the static files, and their manifest.
+
+    Files from previous builds are kept, for pages still cached somewhere that
+    refer to them. Return the manifest.
+    """
+    import gzip
+
+    manifest = {}
+    for path in sorted(static_dir.rglob("*")):
+        if not path.is_file() or build_dir in path.parents or path.suffix == ".tmp":
+            continue
+        filename = path.relative_to(static_dir).as_posix()
+        content = path.read_bytes()
+        target = build_dir / hashed_name(filename, content)
+        manifest[filename] = target.relative_to(build_dir).as_posix()
+        if target.exists():
+            continue  # Unchanged since a previous build
+        write_file(target, content)
+        if path.suffix in COMPRESSIBLE_SUFFIXES:
+            variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(content)
+            for suffix, compressed in variants.items():
+                if len(compressed) < len(content):
+                    write_file(target.with_name(target.name + suffix), compressed)
+    write_file(build_dir / MANIFEST_FILENAME, json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+def load_manifest(build_dir=BUILD_DIR):
+    try:
+        return json.loads((build_dir / MANIFEST_FILENAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename):
+    """Return the URL of a static file, versioned if the assets are built."""
+    manifest = current_app.extensions["kerkoapp_assets"]
+    if filename in manifest:
+        return url_for("assets.serve", filename=manifest[filename])
+    if filename in VENDORED and not (STATIC_DIR / filename).exists():
+        return VENDORED[filename][0]
+    return url_for("static", filename=filename)
+
+
+@assets_bp.route("/assets/<path:filename>")
+def serve(filename):
+    if filename == MANIFEST_FILENAME:
+        abort(404)
+    encodings = [("br", ".br"), ("gzip", ".gz")]
+    for encoding, suffix in encodings:
+        if request.accept_encodings[encoding] and (BUILD_DIR / (filename + suffix)).is_file():
+            response = send_from_directory(
+                BUILD_DIR,
+                filename + suffix,
+                mimetype=guess_mimetype(filename),
+                max_age=IMMUTABLE_MAX_AGE,
+            )
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(BUILD_DIR, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def init_app(app: Flask) -> None:
+    # A build only gets picked up on restart, like code changes
+    app.extensions["kerkoapp_assets"] = load_manifest()
+    app.register_blueprint(assets_bp)
+    app.add_template_global(asset_url)
+
+
+def main():
+    """Build the assets, exiting with an error if any library could not be vendored."""
+    failed = False
+    for filename, error in fetch_vendored().items():
+        if error:
+            print(f"Unable to download {filename}: {error}", file=sys.stderr)  # noqa: T201
+            failed = True
+        else:
+            print(f"Downloaded {filename}.")  # noqa: T201
+    manifest = build_assets()
+    print(f"Built {len(manifest)} asset(s) in '{BUILD_DIR}'.")  # noqa: T201
+    # Otherwise, a Docker image would silently fall back to the CDN
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
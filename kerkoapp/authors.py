@@ -0,0 +1,299 @@
+"""
+Per-author statistics, maintained incrementally at sync time.
+
+Creators are identified by their normalized name. For each of them, the store
+keeps the number of works, the total of their `CitedBy` counts, their h-index
+and the span of their publication years. After each Kerko sync, only the items
+changed since the previous update get applied, and only the authors of those
+items get their statistics recomputed.
+
+Two files are written under Kerko's data directory: the state needed for the
+next incremental update, and a smaller view holding the statistics along with
+precomputed leaderboards, from which requests get served.
+"""
+
+import re
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+from kerko.shortcuts import config
+from kerko.storage import get_storage_dir
+from kerko.tags import TagGate
+
+from .caching import GenerationCache
+from .deltas import cache_changes, get_cache_version
+from .enrichment import get_citations, get_citations_generation, get_citations_view
+from .metrics import cache_collector, register_collector, timed
+from .storage import load_pickle, save_pickle
+
+# Bump this whenever the layout of the stored data changes, so that files
+# written by an older version get rebuilt instead of breaking the views.
+AUTHORS_STORE_VERSION = 3
+
+# Leaderboard orders, by sort key. Authors are ranked by the first statistic,
+# with ties broken by the next ones, then by name.
+LEADERBOARD_SORTS = {
+    "citations": ("citations", "works", "h_index"),
+    "works": ("works", "citations", "h_index"),
+    "h_index": ("h_index", "citations", "works"),
+}
+
+# Items that are not works of their creators.
+EXCLUDED_ITEM_TYPES = {"attachment", "note", "annotation"}
+
+YEAR_RE = re.compile(r"\b(\d{4})\b")
+
+# Author statistics and leaderboards, reused until the view file changes
+authors_cache = GenerationCache("authors")
+register_collector(cache_collector("authors", authors_cache))
+
+
+def get_state_path():
+    return Path(get_storage_dir("dashboard")) / "authors-state.pickle"
+
+
+def get_view_path():
+    return Path(get_storage_dir("dashboard")) / "authors.pickle"
+
+
+def normalize_name(name):
+    # Ignore case, accents, punctuation and spacing differences
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r"[^\w\s-]", " ", name)
+    return " ".join(name.split())
+
+
+def get_item_authors(data):
+    """Return the display names of an item's creators, by normalized name."""
+    authors = {}
+    for creator in data.get("creators", []):
+        if creator.get("name"):
+            # Single-field name, e.g., an organization
+            display_name = creator["name"].strip()
+            author_id = normalize_name(creator["name"])
+        else:
+            first_name = creator.get("firstName", "")
+            last_name = creator.get("lastName", "")
+            display_name = f"{first_name} {last_name}".strip()
+            author_id = f"{normalize_name(last_name)}, {normalize_name(first_name)}".strip(", ")
+        if author_id:
+            authors.setdefault(author_id, display_name)
+    return authors
+
+
+def get_filters():
+    """Return Kerko's tag filters, which decide what items the bibliography includes."""
+    return [config("kerko.zotero.item_include_re"), config("kerko.zotero.item_exclude_re")]
+
+
+def get_publication_year(item):
+    # Zotero's parsed date is more reliable than the free-form date field
+    parsed_date = item.get("meta", {}).get("parsedDate", "")
+    m = YEAR_RE.match(parsed_date) or YEAR_RE.search(item.get("data", {}).get("date", ""))
+    return int(m.group(1)) if m else None
+
+
+def summarize_item(item, gate, citations_view):
+    """
+    Return what the author statistics need to know about a cached item.
+
+    Return `None` for child items, for items that are not works, e.g.,
+    standalone notes, and for items that Kerko's tag filters exclude.
+    """
+    data = item.get("data", {})
+    if item.get("parentItem") or data.get("itemType") in EXCLUDED_ITEM_TYPES:
+        return None
+    if not gate.check(data):
+        return None
+    return {
+        "authors": get_item_authors(data),
+        "cited_by": get_citations(data, citations_view).cited_by or 0,
+        "year": get_publication_year(item),
+    }
+
+
+def compute_h_index(citation_counts):
+    h_index = 0
+    for rank, count in enumerate(sorted(citation_counts, reverse=True), start=1):
+        if count < rank:
+            break
+        h_index = rank
+    return h_index
+
+
+def compute_author_stats(name, records):
+    years = Counter(record["year"] for record in records if record["year"])
+    return {
+        "name": name,
+        "works": len(records),
+        "citations": sum(record["cited_by"] for record in records),
+        "h_index": compute_h_index(record["cited_by"] for record in records),
+        "first_year": min(years) if years else None,
+        "last_year": max(years) if years else None,
+        "years": dict(sorted(years.items())),
+    }
+
+
+def new_state():
+    return {
+        "version": AUTHORS_STORE_VERSION,
+        # Cache version at the time of the latest update.
+        "cache_version": 0,
+        # Kerko's tag filters at the time of the latest update.
+        "filters": get_filters(),
+        # Looked up citation counts that the state reflects.
+        "citations_generation": get_citations_generation(),
+        # Summary of every cached item (`None` if not a work), by item key.
+        "items": {},
+        # Keys of the works of each author, by author id.
+        "works": {},
+        # Statistics of each author, by author id.
+        "stats": {},
+    }
+
+
+def load_state():
+    state = load_pickle(get_state_path())
+    if not isinstance(state, dict) or state.get("version") != AUTHORS_STORE_VERSION:
+        return None
+    # A cache older than the state has been cleaned and synced again
+    if state["cache_version"] > get_cache_version():
+        return None
+    # Changing Kerko's tag filters changes which items count
+    if state["filters"] != get_filters():
+        return None
+    # Citation counts looked up since then may change any author's statistics
+    if state["citations_generation"] != get_citations_generation():
+        return None
+    return state
+
+
+def remove_item(state, key, touched):
+    summary = state["items"].pop(key, None)
+    if summary:
+        for author_id in summary["authors"]:
+            state["works"][author_id].discard(key)
+            touched.setdefault(author_id, None)
+
+
+def add_item(state, item, gate, citations_view, touched):
+    summary = summarize_item(item, gate, citations_view)
+    state["items"][item["key"]] = summary
+    if summary:
+        for author_id, display_name in summary["authors"].items():
+            state["works"].setdefault(author_id, set()).add(item["key"])
+            # The most recently updated item provides the display name
+            touched[author_id] = display_name
+
+
+def apply_changes(state, changes):
+    """
+    Apply the changes of Kerko's cache to the state.
+
+    Return the number of items added, updated or removed.
+    """
+    gate = TagGate(*state["filters"])
+    citations_view = get_citations_view()
+    # Authors whose statistics need recomputing, with their new display name
+    touched = {}
+    count = 0
+    for key in changes.removed:
+        remove_item(state, key, touched)
+        count += 1
+    for item in changes.items:
+        remove_item(state, item["key"], touched)
+        add_item(state, item, gate, citations_view, touched)
+        count += 1
+    for author_id, display_name in touched.items():
+        keys = state["works"].get(author_id)
+        if not keys:
+            state["works"].pop(author_id, None)
+            state["stats"].pop(author_id, None)
+            continue
+        name = display_name or state["stats"][author_id]["name"]
+        records = [state["items"][key] for key in keys]
+        state["stats"][author_id] = compute_author_stats(name, records)
+    state["cache_version"] = changes.version
+    return count
+
+
+def build_leaderboards(stats):
+    leaderboards = {}
+    for sort_key, fields in LEADERBOARD_SORTS.items():
+        leaderboards[sort_key] = sorted(
+            stats,
+            key=lambda author_id: (
+                *(-stats[author_id][field] for field in fields),
+                stats[author_id]["name"].casefold(),
+            ),
+        )
+    return leaderboards
+
+
+def update_authors(full=False):
+    """
+    Update the author statistics with the changes of Kerko's cache.
+
+    If there is no usable state from a previous update, or if `full` is true,
+    the statistics get rebuilt from every item.
+
+    Return the number of items processed.
+
+    :raise SearchIndexError: If the cache is missing or empty.
+    """
+    state = None if full else load_state()
+    if state is None:
+        state = new_state()
+    with cache_changes(state["cache_version"], state["items"].keys()) as changes:
+        count = apply_changes(state, changes)
+    save_pickle(get_state_path(), state)
+    save_pickle(
+        get_view_path(),
+        {
+            "version": AUTHORS_STORE_VERSION,
+            "timestamp": time.time(),
+            "authors": state["stats"],
+            "leaderboards": build_leaderboards(state["stats"]),
+        },
+    )
+    return count
+
+
+def get_authors_cache_key():
+    try:
+        return get_view_path().stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_authors_view():
+    view = load_pickle(get_view_path())
+    if not isinstance(view, dict) or view.get("version") != AUTHORS_STORE_VERSION:
+        return None
+    return view
+
+
+def get_authors_view():
+    """Return the author statistics and leaderboards, or `None` if not built yet."""
+    with timed("snapshot_load"):
+        return authors_cache.get(get_authors_cache_key(), load_authors_view)
+
+
+def get_leaderboard(sort_key, limit, offset=0):
+    """
+    Return a page of the leaderboard, as a `(total, authors)` tuple.
+
+    Return `None` if the statistics have not been built yet.
+    """
+    view = get_authors_view()
+    if view is None:
+        return None
+    ranking = view["leaderboards"][sort_key]
+    authors = [
+        {"id": author_id, "rank": rank, **view["authors"][author_id]}
+        for rank, author_id in enumerate(ranking[offset : offset + limit], start=offset + 1)
+    ]
+    return len(ranking), authors
@@ -0,0 +1,223 @@
+"""
+In-process caches for values derived from the Whoosh indexes.
+"""
+
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+TOC_FILENAME_RE = re.compile(r"^_(?P<indexname>.+)_(?P<generation>\d+)\.toc$")
+
+
+def get_index_generation(index_dir, indexname="MAIN"):
+    """
+    Return the latest generation of the Whoosh index in `index_dir`.
+
+    Whoosh writes a new TOC file, with an incremented generation number, each
+    time a writer commits. Looking at file names is much cheaper than opening
+    the index. Return -1 if there is no index in the directory.
+    """
+    generation = -1
+    try:
+        filenames = [p.name for p in Path(index_dir).iterdir()]
+    except OSError:
+        return generation
+    for filename in filenames:
+        m = TOC_FILENAME_RE.match(filename)
+        if m and m.group("indexname") == indexname:
+            generation = max(generation, int(m.group("generation")))
+    return generation
+
+
+def get_index_version(index_dir, indexname="MAIN"):
+    """
+    Return a value that changes with each commit to the Whoosh index in `index_dir`.
+
+    Generation numbers start over when the index gets recreated, e.g., by
+    `flask kerko clean index` followed by a sync, so the version also has the
+    modification time of the latest TOC file. Return `None` if there is no
+    index in the directory.
+    """
+    generation = get_index_generation(index_dir, indexname)
+    if generation < 0:
+        return None
+    try:
+        toc_mtime = (Path(index_dir) / f"_{indexname}_{generation}.toc").stat().st_mtime_ns
+    except OSError:
+        return None  # Gone meanwhile
+    return generation, toc_mtime
+
+
+class GenerationCache:
+    """
+    Keep a single computed value until its key changes.
+
+    The key is typically derived from index generations, so the value gets
+    recomputed once after each commit to the index. Rebuilds are single-flight:
+    when several threads miss at the same time, only one of them computes the
+    value while the others wait for it.
+
+    A process forked afterwards keeps the cached value, but starts with fresh
+    locks and counters.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._key = None
+        self._value = None
+        self._reset_after_fork()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # A lock held by another thread at the time of the fork would never
+        # get released in the child
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuild_seconds = 0.0
+        self.last_rebuild_seconds = 0.0
+
+    def get(self, key, compute):
+        """Return the value cached for `key`, calling `compute()` if needed."""
+        if key is not None and self._key == key:
+            self._count_hit()
+            return self._value
+        with self._lock:
+            # Another thread may have rebuilt the value while we were waiting.
+            if key is not None and self._key == key:
+                self._count_hit()
+                return self._value
+            start_time = time.perf_counter()
+            value = compute()
+            elapsed = time.perf_counter() - start_time
+            self._value = value
+            self._key = key
+            with self._stats_lock:
+                self.misses += 1
+                self.rebuild_seconds += elapsed
+                self.last_rebuild_seconds = elapsed
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._key = None
+            self._value = None
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "rebuild_seconds": self.rebuild_seconds,
+                "last_rebuild_seconds": self.last_rebuild_seconds,
+            }
+
+    def _count_hit(self):
+        with self._stats_lock:
+            self.hits += 1
+
+
+class BackgroundRefreshCache:
+    """
+    Keep a single computed value, refreshing it in the background when stale.
+
+    The value becomes stale when its key changes, or when it is older than
+    `ttl` seconds. A stale value is still returned right away, while a
+    background thread computes the new one (stale-while-revalidate). If that
+    computation fails, the last known value remains in use and the refresh is
+    retried after `retry_interval` seconds. Only the very first computation
+    happens in the calling thread, since there is nothing to serve before it.
+
+    A process forked afterwards keeps the cached value, but starts with fresh
+    locks and counters, and refreshes the value in its own threads.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, name, ttl=60.0, retry_interval=5.0, on_error=None):
+        self.name = name
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.on_error = on_error
+        self._value = self._MISSING
+        self._key = None
+        self._refreshed_at = 0.0
+        self._failed_at = None
+        self._reset_after_fork()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The refresh thread of the parent, if any, does not survive the fork
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def get(self, key, compute):
+        """
+        Return the cached value, calling `compute()` if there is none yet.
+
+        :raise: Any exception raised by the initial `compute()` call.
+        """
+        if self._value is self._MISSING:
+            with self._lock:
+                if self._value is self._MISSING:
+                    self.misses += 1
+                    self._store(key, compute())
+                    return self._value
+        now = time.monotonic()
+        with self._lock:
+            stale = key != self._key or now - self._refreshed_at >= self.ttl
+            if not stale:
+                self.hits += 1
+                return self._value
+            self.stale_hits += 1
+            retry = self._failed_at is None or now - self._failed_at >= self.retry_interval
+            if not self._refreshing and retry:
+                self._refreshing = True
+                threading.Thread(
+                    target=self._refresh,
+                    args=(key, compute),
+                    name=f"{self.name}-refresh",
+                    daemon=True,
+                ).start()
+            return self._value
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "failures": self.failures,
+            }
+
+    def _refresh(self, key, compute):
+        try:
+            value = compute()
+        except Exception as e:  # noqa: BLE001
+            with self._lock:
+                self.failures += 1
+                self._failed_at = time.monotonic()
+                self._refreshing = False
+            if self.on_error:
+                self.on_error(e)
+        else:
+            with self._lock:
+                self._store(key, value)
+                self._failed_at = None
+                self._refreshing = False
+
+    def _store(self, key, value):
+        self._value = value
+        self._key = key
+        self._refreshed_at = time.monotonic()
@@ -0,0 +1,125 @@
+"""
+Index citation metadata recorded in the Zotero `extra` field.
+
+Items may carry lines such as `CitedBy: 12`, `Cites: 40` and `OpenAlex: <url>`
+in their `extra` field. This module adds fields and a sort option to Kerko's
+Composer so that those values get extracted once, at index time, instead of
+being parsed again each time they are needed. Values looked up by
+`flask kerkoapp citations` take precedence, see `kerkoapp.enrichment`.
+"""
+
+from flask_babel import lazy_gettext as _
+from kerko.extractors import Extractor
+from kerko.specs import FieldSpec, SortSpec
+from whoosh.fields import ID, NUMERIC
+
+from .enrichment import ENRICHED_KEYS, get_citations_view, get_enriched
+from .extra import parse_extra
+
+# Search index field keys, by key of the value in the `extra` field.
+NUMERIC_FIELDS = {
+    "CitedBy": "citations_cited_by",
+    "Cites": "citations_cites",
+}
+ID_FIELDS = {
+    "OpenAlex": "citations_openalex",
+    "OpenAccess": "citations_open_access",
+    "OALink": "citations_oa_link",
+}
+
+MOST_CITED_SORT = "most_cited"
+
+# Fields of Kerko's own sorts breaking ties between equally cited items, with
+# whether each of them sorts in reverse order.
+TIEBREAK_FIELDS = (
+    ("sort_date_added", True),
+    ("sort_creator", False),
+    ("sort_title", False),
+)
+
+
+class ExtraExtractor(Extractor):
+    """Extract a value from the key/value pairs of the item's `extra` field."""
+
+    def __init__(self, *, key, default=None, convert=None, **kwargs):
+        """
+        Initialize the extractor.
+
+        :param str key: Key of the value in the `extra` field, e.g. 'CitedBy'.
+
+        :param default: Value to return when the key is missing or invalid.
+
+        :param callable convert: Optional callable to convert the raw string.
+        """
+        super().__init__(**kwargs)
+        self.key = key
+        self.default = default
+        self.convert = convert
+        self._view_context = None
+        self._view = None
+
+    def get_citations_view(self, library_context):
+        # Each pass over the items loads its own library context, so the looked
+        # up values get read once per pass instead of once per item
+        if self._view_context is not library_context:
+            self._view = get_citations_view()
+            self._view_context = library_context
+        return self._view
+
+    def extract(self, item, library_context, spec):  # noqa: ARG002
+        data = item.get("data", {})
+        value = None
+        if self.key in ENRICHED_KEYS:
+            enriched = get_enriched(data, self.get_citations_view(library_context))
+            if enriched is not None:
+                value = enriched[ENRICHED_KEYS[self.key]]
+        if value is None:
+            value = parse_extra(data.get("extra", "")).get(self.key)
+        if value is None:
+            return self.default
+        if self.convert:
+            try:
+                return self.convert(value)
+            except ValueError:
+                self.warning(f"Invalid {self.key} value '{value}'", item)
+                return self.default
+        return value
+
+
+def add_citation_fields(composer):
+    """Add the citation fields and the "Most cited" sort option to the Composer."""
+    for extra_key, field_key in NUMERIC_FIELDS.items():
+        composer.add_field(
+            FieldSpec(
+                key=field_key,
+                field_type=NUMERIC(stored=True, sortable=True),
+                # Default to 0 so that every document sorts predictably.
+                extractor=ExtraExtractor(key=extra_key, default=0, convert=int),
+            )
+        )
+    for extra_key, field_key in ID_FIELDS.items():
+        composer.add_field(
+            FieldSpec(
+                key=field_key,
+                field_type=ID(stored=True),
+                extractor=ExtraExtractor(key=extra_key),
+            )
+        )
+    # Break ties by date added, creator and title, those of them whose sort the
+    # configuration has not disabled.
+    fields = [composer.fields["citations_cited_by"]]
+    reverse = [True]
+    for field_key, field_reverse in TIEBREAK_FIELDS:
+        field = composer.fields.get(field_key)
+        if field is not None:
+            fields.append(field)
+            reverse.append(field_reverse)
+    composer.add_sort(
+        SortSpec(
+            key=MOST_CITED_SORT,
+            label=_("Most cited"),
+            weight=5,
+            fields=fields,
+            reverse=reverse,
+        )
+    )
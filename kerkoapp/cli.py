@@ -0,0 +1,252 @@
+"""
+Command line interface of KerkoApp.
+
+The commands are available through `flask kerkoapp <subcommand>`.
+"""
+
+import sys
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import assets as static_assets
+from . import authors as authors_store
+from . import dashboard, enrichment
+from . import export as library_export
+from . import warmup as cache_warmup
+from .config_helpers import kerkoapp_config
+
+
+@click.group()
+def cli():
+    """Run a KerkoApp subcommand."""
+
+
+@cli.command()
+@click.option("--full", is_flag=True, help="Rebuild the statistics from every item.")
+@with_appcontext
+def snapshot(full):
+    """
+    Build the dashboard statistics snapshot.
+
+    The dashboard serves its statistics from this snapshot instead of scanning
+    the whole index on every request. It gets updated automatically after each
+    `flask kerko sync`, from the items changed since the previous update only,
+    unless `--full` is given.
+    """
+    try:
+        path = dashboard.build_snapshot(full=full)
+    except Exception as e:
+        current_app.logger.exception("Unable to build the dashboard snapshot.")
+        raise click.Abort from e
+    current_app.logger.info("Dashboard snapshot saved to '%s'.", path)
+
+
+@cli.command()
+@click.option("--full", is_flag=True, help="Rebuild the statistics from every item.")
+@with_appcontext
+def authors(full):
+    """
+    Update the per-author statistics.
+
+    Only the items changed in Kerko's cache since the previous update get
+    processed, unless `--full` is given. The statistics get updated
+    automatically after each `flask kerko sync`.
+    """
+    try:
+        count = authors_store.update_authors(full=full)
+    except Exception as e:
+        current_app.logger.exception("Unable to update the author statistics.")
+        raise click.Abort from e
+    current_app.logger.info("Author statistics updated (%d item(s) processed).", count)
+
+
+@cli.command()
+@click.option("--full", is_flag=True, help="Look up every DOI, even those looked up recently.")
+@click.option(
+    "--no-sync",
+    is_flag=True,
+    help="Only save the citation counts, leaving the search index and the dashboard "
+    "statistics to be updated by the next `flask kerko sync`.",
+)
+@click.pass_context
+@with_appcontext
+def citations(ctx, full, no_sync):
+    """
+    Look up the citation counts of the items on OpenAlex.
+
+    The DOIs of the items in Kerko's cache get looked up in batches, skipping
+    those looked up recently, unless `--full` is given. An interrupted run
+    resumes where it stopped. If any count has changed, the search index gets
+    rebuilt, then the dashboard snapshot and author statistics get updated.
+    See `[kerkoapp.citations]` in the configuration.
+    """
+    try:
+        outcomes, changed = enrichment.update_citations(full=full)
+    except Exception as e:
+        current_app.logger.exception("Unable to look up the citation counts.")
+        raise click.Abort from e
+    current_app.logger.info(
+        "Citation lookups done: %d batch(es) found, %d unchanged, %d failed, "
+        "%d retried request(s).",
+        outcomes["found"],
+        outcomes["unchanged"],
+        outcomes["failed"],
+        outcomes["retries"],
+    )
+    if not changed:
+        current_app.logger.info("The citation counts have not changed.")
+        return
+    if no_sync:
+        return
+    # Kerko's index sync rebuilds the whole index from its cache
+    from kerko.storage import SearchIndexError
+    from kerko.sync.index import sync_index
+
+    try:
+        sync_index()
+    except SearchIndexError as e:
+        current_app.logger.exception("Unable to rebuild the search index.")
+        raise click.Abort from e
+    ctx.invoke(snapshot)
+    ctx.invoke(authors)
+    warm_up_after_sync(ctx)
+
+
+@cli.command()
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(list(library_export.EXPORT_FORMATS)),
+    help="Format of the export (default: from the output file's extension, else csv).",
+)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="File to write, gzip-compressed if its name ends with '.gz'.",
+)
+@with_appcontext
+def export(fmt, output):
+    """
+    Export every item of the library, as processed for the dashboard.
+
+    The items get streamed from Kerko's cache, so the export takes constant
+    memory whatever the size of the library. Parquet requires the optional
+    `pyarrow` package.
+    """
+    compress = output.endswith(".gz")
+    if fmt is None:
+        suffix = output.removesuffix(".gz").rpartition(".")[2]
+        fmt = suffix if suffix in library_export.EXPORT_FORMATS else "csv"
+    if not library_export.is_format_available(fmt):
+        current_app.logger.error("The %s format requires the 'pyarrow' package.", fmt)
+        raise click.Abort
+    chunks = library_export.iter_export(fmt)
+    if compress:
+        chunks = library_export.iter_gzip(chunks)
+    try:
+        # The app logs to stdout, hence no writing of the export there
+        with click.open_file(output, "wb", atomic=True) as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except Exception as e:
+        current_app.logger.exception("Unable to export the library.")
+        raise click.Abort from e
+    current_app.logger.info("Library exported to '%s'.", output)
+
+
+@cli.command()
+@with_appcontext
+def assets():
+    """
+    Build the versioned static assets.
+
+    Third-party libraries missing from the static folder get downloaded first,
+    and checked against their pinned digest. The command fails if any of them
+    could not be vendored. The server must be restarted to use a new build.
+    """
+    failed = False
+    for filename, error in static_assets.fetch_vendored().items():
+        if error:
+            current_app.logger.error("Unable to download %s: %s", filename, error)
+            failed = True
+        else:
+            current_app.logger.info("Downloaded %s.", filename)
+    manifest = static_assets.build_assets()
+    current_app.logger.info("Built %d asset(s) in '%s'.", len(manifest), static_assets.BUILD_DIR)
+    if failed:
+        raise click.Abort
+
+
+@cli.command()
+@click.option(
+    "--url",
+    "urls",
+    multiple=True,
+    help="URL to request, instead of those of the configuration (repeatable).",
+)
+@click.option("--no-history", is_flag=True, help="Do not record the timings in the history.")
+@with_appcontext
+def warmup(urls, no_history):
+    """
+    Warm up the caches by requesting the most visited pages.
+
+    The pages get requested through the test client, and the time each of them
+    takes gets reported. This runs automatically after each `flask kerko sync`.
+    See `[kerkoapp.warmup]` in the configuration.
+    """
+    try:
+        timings = cache_warmup.warm_up_pages(list(urls) or None)
+    except Exception as e:
+        current_app.logger.exception("Unable to warm up the caches.")
+        raise click.Abort from e
+    for timing in timings:
+        ms, status, size, url = timing["ms"], timing["status"], timing["bytes"], timing["url"]
+        current_app.logger.info("%8.1f ms  %s  %9d B  %s", ms, status, size, url)
+    total_ms = sum(timing["ms"] for timing in timings)
+    current_app.logger.info("Warmed up %d page(s) in %.0f ms.", len(timings), total_ms)
+    if any(timing["status"] >= 500 for timing in timings):  # noqa: PLR2004
+        current_app.logger.warning("Some pages responded with an error.")
+    if not no_history:
+        cache_warmup.save_history(timings)
+
+
+def warm_up_after_sync(ctx):
+    if kerkoapp_config(current_app).warmup.after_sync:
+        ctx.invoke(warmup)
+
+
+@click.pass_context
+def after_kerko_command(ctx, _result, **_kwargs):
+    """Refresh the statistics and warm up the caches once Kerko's sync has completed."""
+    if ctx.invoked_subcommand == "sync":
+        ctx.invoke(snapshot)
+        ctx.invoke(authors)
+        warm_up_after_sync(ctx)
+
+
+def hook_kerko_commands():
+    """
+    Have `after_kerko_command` run after each `flask kerko` command.
+
+    The Flask CLI loads Kerko's commands through their entry point, before it
+    creates the app. Importing them otherwise would only slow down the start
+    of web workers, so the hook only gets set if they are already loaded.
+    """
+    kerko_cli_module = sys.modules.get("kerko.cli")
+    if kerko_cli_module is None:
+        return
+    kerko_cli = kerko_cli_module.cli
+    # Click chains result callbacks, hence set it only once per process
+    if getattr(kerko_cli, "kerkoapp_hooked", False):
+        return
+    kerko_cli.result_callback()(after_kerko_command)
+    kerko_cli.kerkoapp_hooked = True
+
+
+def init_app(app):
+    app.cli.add_command(cli, "kerkoapp")
+    hook_kerko_commands()
@@ -1,9 +1,20 @@
+import hashlib
+import os
 import pathlib
-from typing import Optional
+import pickle
+from typing import Literal, Optional
 
+import kerko.config_helpers as kerko_config_helpers
 from flask import Flask
 from kerko.config_helpers import config_update, load_toml
-from pydantic import BaseModel, ConfigDict, NonNegativeInt
+from pydantic import BaseModel, ConfigDict, Field, NonNegativeInt, PositiveFloat, PositiveInt
+
+# Bump this whenever the way the configuration gets loaded changes, so that
+# configurations cached by an older version get parsed again.
+CONFIG_CACHE_VERSION = 1
+
+# Configuration values that are not plain data, and get built at each start.
+UNCACHED_CONFIG_KEYS = {"kerko_composer"}
 
 
 class ProxyFixModel(BaseModel):
@@ -17,10 +28,148 @@ class ProxyFixModel(BaseModel):
     x_prefix: NonNegativeInt = 0
 
 
+class HttpCacheModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: bool = True
+    max_age: NonNegativeInt = 0
+    shared_max_age: NonNegativeInt = 60
+    memory: bool = True
+
+
+class SearchCacheModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: bool = True
+    max_entries: PositiveInt = 256
+    max_bytes: PositiveInt = 33_554_432
+
+
+class LoggingModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    queue_size: PositiveInt = 10_000
+    when_full: Literal["drop", "block"] = "drop"
+    max_bytes: PositiveInt = 10_485_760
+    backup_count: NonNegativeInt = 10
+
+
+class MetricsModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: bool = False
+    path: str = "/metrics"
+    dump_interval: PositiveFloat = 1.0
+    access_log: bool = False
+
+
+class ProfilingModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: bool = False
+    slow_threshold: PositiveFloat = 2.0
+    sample_rate: float = Field(0.0, ge=0.0, le=1.0)
+    interval: PositiveFloat = 0.005
+    max_files: PositiveInt = 100
+    max_bytes: PositiveInt = 52_428_800
+
+
+class CitationsModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    api_url: str = "https://api.openalex.org"
+    mailto: str = ""
+    batch_size: int = Field(50, ge=1, le=100)
+    workers: PositiveInt = 4
+    rate_limit: PositiveFloat = 8.0
+    max_attempts: PositiveInt = 5
+    backoff: PositiveFloat = 1.0
+    timeout: PositiveFloat = 30.0
+    max_age: PositiveInt = 604_800
+    save_interval: PositiveFloat = 10.0
+
+
+class ExportModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: bool = False
+    chunk_size: PositiveInt = 1000
+
+
+class AsgiModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    threads: PositiveInt = 8
+    inline_cached_pages: bool = True
+
+
+class WarmupModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    after_sync: bool = True
+    urls: list[str] = [
+        "/",
+        "/bibliography/",
+        "/bibliography/dashboard",
+        "/bibliography/dashboard/authors",
+    ]
+    landing_searches: bool = True
+    facet_pages: NonNegativeInt = 10
+
+
+class TemplatesModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    bytecode_cache: bool = True
+
+
 class KerkoAppModel(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
     proxy_fix: Optional[ProxyFixModel] = None
+    http_cache: HttpCacheModel = HttpCacheModel()
+    search_cache: SearchCacheModel = SearchCacheModel()
+    logging: LoggingModel = LoggingModel()
+    metrics: MetricsModel = MetricsModel()
+    profiling: ProfilingModel = ProfilingModel()
+    citations: CitationsModel = CitationsModel()
+    export: ExportModel = ExportModel()
+    warmup: WarmupModel = WarmupModel()
+    templates: TemplatesModel = TemplatesModel()
+    asgi: AsgiModel = AsgiModel()
+
+
+def kerkoapp_config(app: Flask) -> KerkoAppModel:
+    """
+    Return the parsed `[kerkoapp]` configuration.
+
+    If the configuration files have no `[kerkoapp]` section, the defaults are
+    returned.
+    """
+    return app.config.get("kerko_config.kerkoapp") or KerkoAppModel()
+
+
+def find_config_files(app: Flask, path_spec: Optional[str]) -> list[pathlib.Path]:
+    """
+    Return the paths of the existing configuration files, in loading order.
+
+    See `load_config_files` for the format of `path_spec` and how paths get
+    resolved.
+    """
+    cwd_parents = [pathlib.Path.cwd(), *pathlib.Path.cwd().parents]
+    instance_path = pathlib.Path(app.instance_path)
+    instance_parents = [instance_path, *instance_path.parents]
+    try_parents = cwd_parents + [p for p in instance_parents if p not in cwd_parents]
+    if not path_spec:
+        path_spec = "config.toml;instance.toml;.secrets.toml"
+    paths = []
+    for path_item in path_spec.split(";"):
+        for parent in try_parents:
+            path = parent / path_item.strip()
+            if path.is_file():
+                paths.append(path)
+                break
+    return paths
 
 
 def load_config_files(app: Flask, path_spec: Optional[str]):
@@ -40,15 +189,68 @@ def load_config_files(app: Flask, path_spec: Optional[str]):
     still not found, the same search is reapplied, this time starting from the
     application's instance directory.
     """
-    cwd_parents = [pathlib.Path.cwd(), *pathlib.Path.cwd().parents]
-    instance_path = pathlib.Path(app.instance_path)
-    instance_parents = [instance_path, *instance_path.parents]
-    try_parents = cwd_parents + [p for p in instance_parents if p not in cwd_parents]
-    if not path_spec:
-        path_spec = "config.toml;instance.toml;.secrets.toml"
-    for path_item in path_spec.split(";"):
-        for parent in try_parents:
-            path = parent / path_item.strip()
-            if path.is_file():
-                config_update(app.config, load_toml(path, verbose=app.config["DEBUG"]))
-                break
+    for path in find_config_files(app, path_spec):
+        config_update(app.config, load_toml(path, verbose=app.config["DEBUG"]))
+
+
+def get_config_cache_path(app: Flask) -> pathlib.Path:
+    return pathlib.Path(app.instance_path) / "config-cache.pickle"
+
+
+def get_config_cache_key(app: Flask, path_spec: Optional[str], env_prefix: str) -> str:
+    """
+    Return a digest of everything the parsed configuration depends on.
+
+    That is the configuration files with their modification times and sizes,
+    the environment variables with the given prefix, the debug flag, and the
+    code that defines and validates the configuration.
+    """
+    parts = [CONFIG_CACHE_VERSION, app.config["DEBUG"]]
+    kerko_dir = pathlib.Path(kerko_config_helpers.__file__).parent
+    code_files = [
+        pathlib.Path(__file__),
+        pathlib.Path(__file__).with_name("__init__.py"),
+        kerko_dir / "config_helpers.py",
+        kerko_dir / "default_config.toml",
+    ]
+    for path in [*code_files, *find_config_files(app, path_spec)]:
+        stat = path.stat()
+        parts.append((str(path.resolve()), stat.st_mtime_ns, stat.st_size))
+    parts.extend(sorted((k, v) for k, v in os.environ.items() if k.startswith(f"{env_prefix}_")))
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def load_cached_config(app: Flask, key: str) -> bool:
+    """
+    Update the app's configuration from the cache, if it was saved with `key`.
+
+    Return whether the cache was usable.
+    """
+    try:
+        with get_config_cache_path(app).open("rb") as f:
+            # Safe to unpickle, the file being written by `save_cached_config`
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # Missing, partial or written by another version
+        return False
+    if not isinstance(cached, dict) or cached.get("key") != key:
+        return False
+    app.config.update(cached["config"])
+    return True
+
+
+def save_cached_config(app: Flask, key: str) -> None:
+    """Save the app's parsed configuration to the cache, for later starts."""
+    config = {k: v for k, v in app.config.items() if k not in UNCACHED_CONFIG_KEYS}
+    path = get_config_cache_path(app)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The configuration holds secrets, such as the Zotero API key
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"key": key, "config": config}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
+    except (OSError, pickle.PicklingError) as e:
+        tmp_path.unlink(missing_ok=True)
+        app.logger.warning("Unable to cache the configuration: %s", e)
@@ -1,250 +1,638 @@
-from flask import Blueprint, render_template, current_app
-import re
+from flask import Blueprint, abort, render_template, current_app, request
+import heapq
 import json
-from whoosh.index import open_dir
+import time
+from operator import itemgetter
+from pathlib import Path
+from typing import NamedTuple, Optional
+from whoosh.query import Every
+from whoosh.sorting import Count, Facets, FieldFacet
 from collections import defaultdict
+from kerko.shortcuts import composer
+from kerko.storage import SearchIndexError, get_storage_dir
+
+from .authors import LEADERBOARD_SORTS, get_authors_cache_key, get_leaderboard
+from .caching import GenerationCache, get_index_version
+from .extensions import indexes
+from .enrichment import get_citations, get_citations_view
+from .enrichment import get_view_key as get_citations_view_key
+from .http_caching import cached_page, skip_cache
+from .extra import parse_extra
+from .indexes import get_whoosh_dir
+from .json_responses import json_response
+from .metrics import cache_collector, register_collector, timed
+from .stats import update_stats
 
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Bump this whenever the layout of the snapshot file changes, so that snapshots
+# written by an older version get ignored instead of breaking the dashboard.
+SNAPSHOT_VERSION = 3
+
+# Dashboard statistics, reused until the index changes
+dashboard_cache = GenerationCache('dashboard')
+register_collector(cache_collector('dashboard', dashboard_cache))
+
+# Number of works shown in the "Five Most Cited Works" carousel.
+TOP_CITED_COUNT = 5
+
+# First year of the publications per year chart.
+FIRST_CHART_YEAR = 2012
+
+# Depth of the years in the year facet's tree of centuries, decades and years.
+YEAR_FACET_DEPTH = 3
+
+# Largest page of most cited works or of authors served by the API.
+MAX_PAGE_LIMIT = 100
+
+# Number of authors per page of the authors view.
+AUTHORS_PAGE_SIZE = 50
+
 
 def string_to_dict(input_str):
-    # Split the string by commas to separate key-value pairs
-    # Regular expression to match the first colon after a key (not in a URL)
-    pattern = r"([^:]+):\s*([^,]+(?:https?://[^\s,]+)?)\s*(?:,|\s*$)"
-    
-    # Find all matches
-    matches = re.findall(pattern, input_str)
-    
-    # Convert matches to a dictionary
-    result_dict = {key.strip(): value.strip() for key, value in matches}
+    # Key/value pairs of the item's 'extra' field, see kerkoapp.extra
+    return parse_extra(input_str).as_dict()
 
-    if 'Citation Key Alias' in result_dict:
-        value = result_dict['Citation Key Alias']
-        result = value.split('\n')[0]
-        result_dict = {'lenslink' : result}
+def get_index_dir():
+    # Path to the Whoosh index directory (Kerko's cache of Zotero items)
+    return current_app.config.get("WHOOSH_INDEX_DIR", str(get_whoosh_dir("cache")))
 
-    return result_dict
+def iter_whoosh_items():
+    # Yield the stored fields of every item, one at a time, without ever
+    # holding the whole library in memory
+    with indexes.searcher(get_index_dir()) as searcher:
+        yield from searcher.all_stored_fields()
 
 def get_whoosh_items():
-    # Path to the Whoosh index directory
-    index_dir = current_app.config.get("WHOOSH_INDEX_DIR", "instance/kerko/cache/whoosh")
-    
-    # Open the Whoosh index
-    ix = open_dir(index_dir)
-    
     # Retrieve all items from the Whoosh index
-    items = []
-    with ix.searcher() as searcher:
-        for fields in searcher.all_stored_fields():
-            items.append(fields)
-            # Sort items by date (most recent first) and get top 5
-    items = sorted(items, key=lambda x: x['data'].get('dateAdded', ''), reverse=True)
+    with timed('stored_field_scan'):
+        items = list(iter_whoosh_items())
+    # Sort items by date (most recent first)
+    with timed('sort'):
+        items = sorted(items, key=lambda x: x['data'].get('dateAdded', ''), reverse=True)
 
     return items
 
+class CarouselCard(NamedTuple):
+    """A work of the "Most Cited Works" carousel, flattened for the template."""
+
+    title: str
+    date: str
+    doi: str
+    url: str
+    # Creator names, comma-separated.
+    creators: str
+    cited_by: Optional[int]
+    cites: Optional[int]
+
+def get_creator_name(creator):
+    # Single-field names, e.g., of organizations, have no first and last names
+    if creator.get('name'):
+        return creator['name']
+    return f"{creator.get('firstName', '')} {creator.get('lastName', '')}".strip()
+
+def process_item(item, citations_view):
+    """
+    Return the fields of the carousel card of an item, see `CarouselCard`.
+
+    The result is a plain dict, so that it can be saved in the snapshot.
+    """
+    # Extract data from Zotero's nested structure
+    data = item.get('data', {})
+    # Get citations Data (stored in "extra", or looked up on OpenAlex)
+    citations = get_citations(data, citations_view)
+    names = (get_creator_name(creator) for creator in data.get('creators', []))
+    return {
+        'title': data.get('title', ''),
+        'date': data.get('date', ''),
+        'doi': data.get('DOI', ''),
+        'url': data.get('url', ''),
+        'creators': ', '.join(name for name in names if name),
+        'cited_by': citations.cited_by,
+        'cites': citations.cites,
+    }
+
 def process_for_dashboard(items):
-     # Process Zotero items
-        processed = []
-        for item in items:
-            # Extract data from Zotero's nested structure
-            data = item.get('data', {})
-            newdata = []
-            
-            # Get creators from data
-            creators = []
-            for creator in data.get('creators', []):
-                creators.append({
-                    'name': f"{creator.get('firstName', '')} {creator.get('lastName', '')}".strip()
-                })
-            newdata.append({'creators': creators})
-      
-            
-            # Get citations Data (stored in "extra")
-            extra_str = data.get('extra', '')
-            extra_dict = string_to_dict(extra_str)
-            newdata.append({'extra' : extra_dict})
-
-            newdata.append ({
-                'title' : data.get('title', ''),
-                'date' : data.get('date', ''),
-                'DOI' : data.get('DOI', ''),
-                'url' : data.get('url', '')
-            })
-            processed.append(newdata)
-        return processed
+    # Process Zotero items
+    with timed('processing'):
+        citations_view = get_citations_view()
+        return [process_item(item, citations_view) for item in items]
 
 # Extract and sort items by 'CitedBy' value
 def get_cited_by(item):
-    # Safely extract the 'CitedBy' value, defaulting to 0 if not present
-    extra = next((field['extra'] for field in item if 'extra' in field), {})
-    return int(extra.get('CitedBy', 0))
+    # Safely extract the 'CitedBy' value of a processed item, defaulting to 0
+    return item.get('cited_by') or 0
 
-def get_work_counts_per_year_whoosh(items):
-    year_counts = defaultdict(int)
-    
-    # Search for all items
-    for item in items:
-        data = item.get("data", {})
-        if isinstance(data, dict):
-            date = data.get("date", "")
-            year = date[:4]
-            if year.isdigit() and int(year) >= 2012:
-                year_counts[year] += 1
+def get_item_cited_by(item, citations_view):
+    # Same as get_cited_by(), but straight from the raw index item
+    return get_citations(item.get('data', {}), citations_view).cited_by or 0
+
+def select_top_cited(items, citations_view, k=TOP_CITED_COUNT):
+    """
+    Return the `k` most cited items, most cited first.
 
-    # Print or return results
-    for year in sorted(year_counts):
-        print(f"{year}: {year_counts[year]}")
+    The items are streamed through a bounded heap, which takes O(N log K) time
+    and O(K) memory. Ties are broken by the most recent `dateAdded`, like
+    sorting `get_whoosh_items()` by `get_cited_by` would do.
+    """
+    heap = []
+    for seq, item in enumerate(items):
+        date_added = item.get('data', {}).get('dateAdded', '')
+        key = (get_item_cited_by(item, citations_view), date_added, -seq)
+        if len(heap) < k:
+            heapq.heappush(heap, (key, item))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, item))
+    return [item for _key, item in sorted(heap, key=itemgetter(0), reverse=True)]
+
+def get_top_cited(items, citations_view, k=TOP_CITED_COUNT):
+    # Only the winners ever get turned into carousel entries
+    winners = select_top_cited(items, citations_view, k)
+    return [process_item(item, citations_view) for item in winners]
+
+def query_top_cited(k=TOP_CITED_COUNT):
+    """
+    Return the `k` most cited items, processed for the dashboard.
+
+    The citation counts are read from the sortable field that
+    `kerkoapp.citations` adds to Kerko's search index, so only `k` documents
+    get loaded. Return `None` if the index was built without that field.
+    """
+    page = search_most_cited(k)
+    if page is None:
+        return None
+    citations_view = get_citations_view()
+    return [process_item({'data': data}, citations_view) for data in page[1]]
+
+def search_most_cited(limit, offset=0):
+    """
+    Return a page of the most cited items, as a `(total, items)` tuple.
+
+    The items are the `data` dicts of Zotero items. Return `None` if the search
+    index was built without the citation fields.
+    """
+    from .citations import MOST_CITED_SORT
+
+    sort_spec = composer().sorts.get(MOST_CITED_SORT)
+    if sort_spec is None:
+        return None
+    # Same sorting as Kerko's search page would apply for that sort option
+    field_keys = sort_spec.get_field_keys()
+    if isinstance(sort_spec.reverse, bool):
+        sort_args = {'sortedby': field_keys, 'reverse': sort_spec.reverse}
+    else:
+        sort_args = {'sortedby': [
+            FieldFacet(key, reverse=reverse) for key, reverse in zip(field_keys, sort_spec.reverse)
+        ]}
+    try:
+        with indexes.searcher(get_whoosh_dir("index")) as searcher:
+            if not all(key in searcher.schema for key in field_keys):
+                return None
+            with timed('sort'):
+                results = searcher.search(Every(), limit=offset + limit, **sort_args)
+                return len(results), [hit['data'] for hit in results[offset:offset + limit]]
+    except SearchIndexError:
+        return None
+
+def get_indexed_totals():
+    """
+    Return the number of works and their total citation count.
+
+    The citation counts are summed from the column of the sortable citation
+    field. Return `None` if the search index lacks that field.
+    """
+    from .citations import NUMERIC_FIELDS
+
+    field_key = NUMERIC_FIELDS['CitedBy']
+    try:
+        with indexes.searcher(get_whoosh_dir("index")) as searcher:
+            reader = searcher.reader()
+            if not reader.has_column(field_key):
+                return None
+            column = reader.column_reader(field_key)
+            with timed('facet_count'):
+                return {
+                    'works': searcher.doc_count(),
+                    'citations': sum(column[docnum] for docnum in reader.all_doc_ids()),
+                }
+    except SearchIndexError:
+        return None
+
+def get_facet_counts(facet_key):
+    """
+    Return the number of documents by value of a facet of Kerko's search index.
+
+    Return `None` if the facet is disabled or missing from the index. Counts
+    are read from the facet's term index, whose size depends on the number of
+    distinct values; stored documents are never loaded. Documents deleted but
+    not yet merged out of the index would inflate the term counts, hence if
+    the index has deletions, the counts come from a grouped search instead.
+    """
+    spec = composer().facets.get(facet_key)
+    if spec is None:
+        return None
+    try:
+        with indexes.searcher(get_whoosh_dir("index")) as searcher:
+            if spec.key not in searcher.schema:
+                return None
+            with timed('facet_count'):
+                return count_facet_values(searcher, spec)
+    except SearchIndexError:
+        return None
+
+def count_facet_values(searcher, spec):
+    counts = {}
+    reader = searcher.reader()
+    if not reader.has_deletions():
+        field = searcher.schema[spec.key]
+        for term, terminfo in reader.iter_field(spec.key):
+            counts[field.from_bytes(term)] = terminfo.doc_frequency()
+    else:
+        facets = Facets()
+        facets.add_field(spec.key, allow_overlap=spec.allow_overlap)
+        results = searcher.search(Every(), groupedby=facets, maptype=Count, limit=1)
+        counts.update(results.groups(spec.key))
+    return counts
+
+def get_indexed_year_counts():
+    # The year facet is a tree of centuries, decades and years; only the
+    # years are wanted
+    counts = get_facet_counts('facet_year')
+    if counts is None:
+        return None
+    separator = composer().facets['facet_year'].path_separator
+    year_counts = {}
+    for path, count in counts.items():
+        parts = path.split(separator)
+        year = parts[-1]
+        if len(parts) == YEAR_FACET_DEPTH and year.isdigit() and int(year) >= FIRST_CHART_YEAR:
+            year_counts[year] = count
     return year_counts
 
+def get_indexed_item_type_counts():
+    counts = get_facet_counts('facet_item_type')
+    if counts is None:
+        return None
+    codec = composer().facets['facet_item_type'].codec
+    item_type_counts = defaultdict(int)
+    for encoded_value, count in counts.items():
+        item_type, _label = codec.decode(encoded_value, default_value=encoded_value)
+        item_type_counts[item_type] += count
+    return dict(item_type_counts)
+
+def get_item_year(item):
+    # Return the publication year if it is within the dashboard's range
+    data = item.get("data", {})
+    if isinstance(data, dict):
+        year = data.get("date", "")[:4]
+        if year.isdigit() and int(year) >= FIRST_CHART_YEAR:
+            return year
+    return None
+
+def get_item_type(item):
+    data = item.get("data", {})
+    if isinstance(data, dict):
+        return data.get("itemType", "Unknown")
+    return None
+
 def get_item_type_counts(items):
     item_type_counts = defaultdict(int)
     
     # Count occurrences of each itemType
     for item in items:
-        data = item.get("data", {})
-        if isinstance(data, dict):
-            item_type = data.get("itemType", "Unknown")
+        item_type = get_item_type(item)
+        if item_type is not None:
             item_type_counts[item_type] += 1
 
     return item_type_counts
 
-@dashboard_bp.route('/dashboard')
-def index():
+def get_snapshot_path():
+    # The snapshot lives next to Kerko's own data, under the instance dir
+    return Path(get_storage_dir("dashboard")) / "snapshot.json"
+
+def compute_dashboard_stats(items, top_n=TOP_CITED_COUNT, top_cited=None):
+    """
+    Compute every statistic shown on the dashboard from the given index items.
+
+    If `top_cited` is provided, the most cited works are not selected from
+    `items`, which then only feed the histograms.
+
+    The result only contains JSON-serializable values, so that it can be saved
+    as a snapshot.
+    """
+    # Feed a single pass over the items to the histograms and to the top-K
+    # selection, so that `items` may be a lazy generator
+    year_counts = defaultdict(int)
+    item_type_counts = defaultdict(int)
+    totals = {'works': 0, 'citations': 0}
+    citations_view = get_citations_view()
+
+    def count(items):
+        for item in items:
+            totals['works'] += 1
+            totals['citations'] += get_item_cited_by(item, citations_view)
+            year = get_item_year(item)
+            if year:
+                year_counts[year] += 1
+            item_type = get_item_type(item)
+            if item_type is not None:
+                item_type_counts[item_type] += 1
+            yield item
+
+    counted_items = count(items)
+    if top_cited is None:
+        top_cited = get_top_cited(counted_items, citations_view, top_n)
+    else:
+        for _item in counted_items:
+            pass
+    return {
+        'top_cited': top_cited,
+        'years': dict(year_counts),
+        'item_types': dict(item_type_counts),
+        'totals': totals,
+    }
+
+def save_snapshot(stats):
+    """Write the dashboard statistics to the snapshot file, atomically."""
+    path = get_snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'timestamp': time.time(),
+        'data': stats,
+    }
+    tmp_path = path.with_suffix('.tmp')
+    with tmp_path.open('w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    # Replacing the file is atomic, requests never see a partial snapshot
+    tmp_path.replace(path)
+    return path
+
+def load_snapshot():
+    """
+    Return the dashboard statistics saved by `save_snapshot`.
+
+    Return `None` if there is no snapshot, or if it was written by an
+    incompatible version.
+    """
     try:
-        # Get items from Whoosh index
-        items = get_whoosh_items()
+        with get_snapshot_path().open(encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot.get('data')
 
-        # Process items for dashboard tile
-        zotero_items = process_for_dashboard(items)
+def get_live_dashboard_stats():
+    # Prefer the search index's citation fields and facets, and only fall back
+    # to loading every item from the cache if the index lacks them
+    top_cited = query_top_cited()
+    stats = {
+        'top_cited': top_cited,
+        'years': get_indexed_year_counts(),
+        'item_types': get_indexed_item_type_counts(),
+        'totals': get_indexed_totals(),
+    }
+    if all(value is not None for value in stats.values()):
+        return stats
+    with timed('stored_field_scan'):
+        return compute_dashboard_stats(iter_whoosh_items(), top_cited=top_cited)
 
-        # Sort items by 'CitedBy' in descending order
-        sorted_items = sorted(zotero_items, key=get_cited_by, reverse=True)
+def build_snapshot(full=False):
+    """
+    Update the dashboard statistics from Kerko's cache and save them.
 
-        # Take the top 5 items
-        all_data = sorted_items[:5]
-        
-        # Handle empty data
-        if not all_data:
-            all_data = [{
-                'title': 'No Items Found',
-                'creators': [],
-                'abstractNote': 'Please check your Zotero library and API credentials.',
-                'stats': {
-                    'total_citations': 0,
-                    'recent_views': 0,
-                    'author_count': 0
-                }
-            }]
-        
-        # Get entries per year data from Whoosh index items
-        year_data = get_work_counts_per_year_whoosh(items)
-        years = sorted(year_data.keys())
-        counts = [year_data[year] for year in years]
-
-        # Generate bar chart data
-        chart_data = {
-            'type': 'bar',
-            'data': {
-                'labels': years,
-                'datasets': [{
-                    'label': 'Publications per Year',
-                    'data': counts,
-                    'backgroundColor': 'rgba(0, 123, 255, 0.5)',
-                    'borderColor': 'rgba(0, 123, 255, 1)',
-                    'borderWidth': 1
-                }]
-            },
-            'options': {
-                'responsive': True,
-                'scales': {
-                    'yAxes': [{
-                        'ticks': {
-                            'beginAtZero': True
-                        }
-                    }]
-                }
-            }
-        }
-
-        # Get item type counts for pie chart
-        item_type_data = get_item_type_counts(items)
-        item_types = list(item_type_data.keys())
-        item_counts = list(item_type_data.values())
-
-        # Generate pie chart data
-        pie_chart_data = {
-            'type': 'pie',
-            'data': {
-                'labels': item_types,
-                'datasets': [{
-                    'data': item_counts,
-                    'backgroundColor': [
-                        'rgba(255, 99, 132, 0.5)',
-                        'rgba(54, 162, 235, 0.5)',
-                        'rgba(255, 206, 86, 0.5)',
-                        'rgba(75, 192, 192, 0.5)',
-                        'rgba(153, 102, 255, 0.5)',
-                        'rgba(255, 159, 64, 0.5)',
-                        'rgba(201, 203, 207, 0.5)',
-                        'rgba(255, 87, 51, 0.5)',
-                        'rgba(60, 179, 113, 0.5)',
-                        'rgba(123, 104, 238, 0.5)',
-                        'rgba(255, 140, 0, 0.5)',
-                        'rgba(0, 191, 255, 0.5)',
-                        'rgba(220, 20, 60, 0.5)',
-                        'rgba(34, 139, 34, 0.5)',
-                        'rgba(255, 215, 0, 0.5)',
-                        'rgba(70, 130, 180, 0.5)',
-                        'rgba(199, 21, 133, 0.5)',
-                        'rgba(244, 164, 96, 0.5)'
-                    ],
-                    'borderColor': [
-                        'rgba(255, 99, 132, 1)',
-                        'rgba(54, 162, 235, 1)',
-                        'rgba(255, 206, 86, 1)',
-                        'rgba(75, 192, 192, 1)',
-                        'rgba(153, 102, 255, 1)',
-                        'rgba(255, 159, 64, 1)',
-                        'rgba(201, 203, 207, 1)',
-                        'rgba(255, 87, 51, 1)',
-                        'rgba(60, 179, 113, 1)',
-                        'rgba(123, 104, 238, 1)',
-                        'rgba(255, 140, 0, 1)',
-                        'rgba(0, 191, 255, 1)',
-                        'rgba(220, 20, 60, 1)',
-                        'rgba(34, 139, 34, 1)',
-                        'rgba(255, 215, 0, 1)',
-                        'rgba(70, 130, 180, 1)',
-                        'rgba(199, 21, 133, 1)',
-                        'rgba(244, 164, 96, 1)'
-                    ],
-                    'borderWidth': 1
-                }]
-            },
-            'options': {
-                'responsive': True
-            }
-        }
+    Only the items changed since the previous build get processed, unless
+    `full` is true. See `kerkoapp.stats`.
+    """
+    stats, _count = update_stats(TOP_CITED_COUNT, full=full)
+    citations_view = get_citations_view()
+    return save_snapshot({
+        'top_cited': [process_item({'data': data}, citations_view) for data in stats['top_cited']],
+        'years': {
+            str(year): count for year, count in stats['years'].items() if year >= FIRST_CHART_YEAR
+        },
+        'item_types': stats['item_types'],
+        'totals': stats['totals'],
+    })
 
-        return render_template("dashboard.html.jinja2", 
-                             all_data=all_data,
-                             chartJSON=json.dumps(chart_data),
-                             pieChartJSON=json.dumps(pie_chart_data),
-                             rss_feed_url=(current_app.config['SERVER_NAME'] or 'http://localhost') + '/feed.rss')
+def get_dashboard_cache_key():
+    # The cached dashboard stays valid until Kerko commits to the cache or
+    # to the search index, or recreates them, or until the snapshot or the
+    # looked up citation counts get updated
+    try:
+        snapshot_mtime = get_snapshot_path().stat().st_mtime_ns
+    except OSError:
+        snapshot_mtime = None
+    return (
+        get_index_version(get_index_dir()),
+        get_index_version(get_whoosh_dir("index")),
+        snapshot_mtime,
+        get_citations_view_key(),
+    )
+
+def load_dashboard_stats():
+    # Serve the statistics precomputed at sync time, only scanning the
+    # Whoosh index if no usable snapshot has been built yet
+    with timed('snapshot_load'):
+        stats = load_snapshot()
+    if stats is None:
+        current_app.logger.warning(
+            "Dashboard snapshot not found, computing statistics from the index. "
+            "Run 'flask kerkoapp snapshot' to build it."
+        )
+        stats = get_live_dashboard_stats()
+    return stats
+
+def get_dashboard_stats():
+    return dashboard_cache.get(get_dashboard_cache_key(), load_dashboard_stats)
+
+def preload_dashboard_stats():
+    """
+    Cache the dashboard snapshot, if there is one, without touching the index.
+
+    Return whether a snapshot was found. See `kerkoapp.preload`.
+    """
+    stats = load_snapshot()
+    if stats is None:
+        return False
+    dashboard_cache.get(get_dashboard_cache_key(), lambda: stats)
+    return True
+
+def get_dashboard_context(stats):
+    """
+    Return the template variables of the dashboard, ready to be rendered.
+
+    The template only has to output the fields of each `CarouselCard`. The
+    charts get loaded by the page from the API endpoints below.
+    """
+    return {
+        'cards': [CarouselCard(**card) for card in stats['top_cited']],
+    }
+
+@dashboard_bp.route('/dashboard')
+@cached_page(get_dashboard_cache_key)
+def index():
+    try:
+        stats = get_dashboard_stats()
+        with timed('processing'):
+            context = get_dashboard_context(stats)
+        with timed('template_render'):
+            rss_feed_url = (current_app.config['SERVER_NAME'] or 'http://localhost') + '/feed.rss'
+            return render_template("dashboard.html.jinja2", **context, rss_feed_url=rss_feed_url)
         
     except Exception as e:
-        all_data = [{
-            'title': 'Error Loading Items',
-            'creators': [],
-            'abstractNote': f'An error occurred: {str(e)}. Please check your Zotero API credentials.',
-            'stats': {
-                'total_citations': 0,
-                'recent_views': 0,
-                'author_count': 0
-            }
-        }]
+        skip_cache()
         return render_template("dashboard.html.jinja2", 
-                             all_data=all_data,
+                             cards=[],
+                             error=str(e),
                              rss_feed_url=(current_app.config['SERVER_NAME'] or 'http://localhost') + '/feed.rss')
 
+# Read-only JSON API, used by the dashboard's charts and open to other sites.
+# Responses get the same ETag-based caching as the dashboard page itself.
+
+def api_error(message, status):
+    skip_cache()
+    return json_response({'error': message}, status=status)
+
+def serialize_item(data, citations_view):
+    # Flat representation of an item's `data`, for the API
+    citations = get_citations(data, citations_view)
+    return {
+        'key': data.get('key', ''),
+        'title': data.get('title', ''),
+        'creators': [get_creator_name(creator) for creator in data.get('creators', [])],
+        'date': data.get('date', ''),
+        'DOI': data.get('DOI', ''),
+        'url': data.get('url', ''),
+        'cited_by': citations.cited_by or 0,
+        'cites': citations.cites or 0,
+    }
+
+@dashboard_bp.route('/dashboard/api/years')
+@cached_page(get_dashboard_cache_key)
+def api_years():
+    try:
+        year_counts = get_dashboard_stats()['years']
+    except SearchIndexError as e:
+        return api_error(str(e), 503)
+    return json_response({
+        'years': [{'year': int(year), 'count': year_counts[year]} for year in sorted(year_counts)],
+    })
+
+@dashboard_bp.route('/dashboard/api/item-types')
+@cached_page(get_dashboard_cache_key)
+def api_item_types():
+    try:
+        item_type_counts = get_dashboard_stats()['item_types']
+    except SearchIndexError as e:
+        return api_error(str(e), 503)
+    return json_response({
+        'item_types': [
+            {'item_type': item_type, 'count': count}
+            for item_type, count in sorted(
+                item_type_counts.items(), key=itemgetter(1), reverse=True
+            )
+        ],
+    })
+
+@dashboard_bp.route('/dashboard/api/totals')
+@cached_page(get_dashboard_cache_key)
+def api_totals():
+    try:
+        totals = get_dashboard_stats()['totals']
+    except SearchIndexError as e:
+        return api_error(str(e), 503)
+    return json_response(totals)
+
+def get_page_args(default_limit):
+    """
+    Return the `limit` and `offset` query string arguments.
+
+    :raise ValueError: If the arguments are invalid.
+    """
+    try:
+        limit = int(request.args.get('limit', default_limit))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        msg = "'limit' and 'offset' must be integers."
+        raise ValueError(msg) from None
+    if not 1 <= limit <= MAX_PAGE_LIMIT or offset < 0:
+        msg = f"'limit' must be between 1 and {MAX_PAGE_LIMIT}, and 'offset' may not be negative."
+        raise ValueError(msg)
+    return limit, offset
+
+@dashboard_bp.route('/dashboard/api/top-cited')
+@cached_page(get_dashboard_cache_key)
+def api_top_cited():
+    try:
+        limit, offset = get_page_args(TOP_CITED_COUNT)
+    except ValueError as e:
+        return api_error(str(e), 400)
+    citations_view = get_citations_view()
+    try:
+        page = search_most_cited(limit, offset)
+        if page is None:
+            # The search index lacks the citation fields, scan the cache instead
+            items = select_top_cited(iter_whoosh_items(), citations_view, offset + limit)
+            total = get_dashboard_stats()['totals']['works']
+            page = total, [item.get('data', {}) for item in items[offset:]]
+    except SearchIndexError as e:
+        return api_error(str(e), 503)
+    total, items = page
+    return json_response({
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'items': [serialize_item(data, citations_view) for data in items],
+    })
+
+@dashboard_bp.route('/dashboard/api/authors')
+@cached_page(get_authors_cache_key)
+def api_authors():
+    sort_key = request.args.get('sort', 'citations')
+    if sort_key not in LEADERBOARD_SORTS:
+        return api_error(f"'sort' must be one of: {', '.join(LEADERBOARD_SORTS)}.", 400)
+    try:
+        limit, offset = get_page_args(AUTHORS_PAGE_SIZE)
+    except ValueError as e:
+        return api_error(str(e), 400)
+    page = get_leaderboard(sort_key, limit, offset)
+    if page is None:
+        return api_error("Author statistics are not available yet.", 503)
+    total, authors = page
+    return json_response({
+        'total': total,
+        'sort': sort_key,
+        'limit': limit,
+        'offset': offset,
+        'authors': [
+            {key: value for key, value in author.items() if key != 'years'} for author in authors
+        ],
+    })
+
+@dashboard_bp.route('/dashboard/authors')
+@cached_page(get_authors_cache_key)
+def authors():
+    sort_key = request.args.get('sort', 'citations')
+    page_num = request.args.get('page', 1, type=int)
+    if sort_key not in LEADERBOARD_SORTS or page_num < 1:
+        abort(400)
+    page = get_leaderboard(sort_key, AUTHORS_PAGE_SIZE, (page_num - 1) * AUTHORS_PAGE_SIZE)
+    if page is None:
+        abort(503)
+    total, leaderboard = page
+    if page_num > 1 and not leaderboard:
+        abort(404)
+    with timed('template_render'):
+        return render_template(
+            "dashboard_authors.html.jinja2",
+            authors=leaderboard,
+            total=total,
+            sort_key=sort_key,
+            sorts=LEADERBOARD_SORTS,
+            page_num=page_num,
+            page_count=max(1, -(-total // AUTHORS_PAGE_SIZE)),
+        )
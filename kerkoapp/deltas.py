@@ -0,0 +1,80 @@
+"""
+Read what changed in Kerko's cache since a previous sync.
+
+Kerko's cache sync only fetches the items modified since its previous sync,
+and each cached item keeps the Zotero library version at which it was last
+modified. Hence the items changed since version `N` are those whose version is
+greater than `N`, which the cache index can find without loading any other
+item. Items deleted from the library are simply dropped from the cache, and get
+detected by comparing the known item keys with those still in the cache.
+"""
+
+from collections.abc import Iterable
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from kerko.storage import load_object, open_index
+from whoosh.query import NumericRange
+
+
+class CacheChanges(NamedTuple):
+    # Version of the cache that the changes lead to.
+    version: int
+    # Stored fields of the items added or modified since the previous version.
+    items: Iterable[dict]
+    # Keys of the items that are no longer in the cache.
+    removed: set
+
+
+def get_cache_version():
+    """Return the library version of Kerko's cache, or 0 if it was never synced."""
+    return load_object("cache", "version", default=0)
+
+
+@contextmanager
+def cache_changes(since, known_keys=()):
+    """
+    Provide the changes to Kerko's cache since version `since`.
+
+    With `since` at 0, every item counts as added, and gets loaded lazily, one
+    at a time, while iterating over `items`. The iteration must happen within
+    the `with` block.
+
+    :param int since: Cache version of the previous update, or 0.
+
+    :param known_keys: Keys of the items that were in the cache at version
+        `since`, needed to detect removed items.
+
+    :raise SearchIndexError: If the cache is missing or empty.
+    """
+    version = get_cache_version()
+    with open_index("cache").searcher() as searcher:
+        if not since:
+            yield CacheChanges(version, searcher.all_stored_fields(), set())
+            return
+        results = searcher.search(NumericRange("version", since + 1, None), limit=None)
+        items = [hit.fields() for hit in results]
+        keys = set(known_keys)
+        keys.update(item["key"] for item in items)
+        # Unless some item was removed, every key is still there.
+        removed = set()
+        if len(keys) != searcher.doc_count():
+            removed = find_removed_keys(searcher, keys)
+        yield CacheChanges(version, items, removed)
+
+
+def find_removed_keys(searcher, keys):
+    """Return those of `keys` that have no live document in the cache."""
+    reader = searcher.reader()
+    indexed_keys = {term.decode("utf-8") for term in reader.lexicon("key")}
+    removed = {key for key in keys if key not in indexed_keys}
+    if reader.has_deletions():
+        # The keys of deleted documents remain in the lexicon until their
+        # segment gets merged. Those documents are either removed items, or
+        # older versions of updated items.
+        for docnum in range(reader.doc_count_all()):
+            if reader.is_deleted(docnum):
+                key = reader.stored_fields(docnum).get("key")
+                if key in keys and searcher.document_number(key=key) is None:
+                    removed.add(key)
+    return removed
@@ -0,0 +1,486 @@
+"""
+Citation counts looked up from OpenAlex, kept next to Kerko's data.
+
+`flask kerkoapp citations` looks up the DOIs of the items in Kerko's cache on
+an OpenAlex-compatible API, and saves the counts found in a sidecar store.
+Wherever the app reads citation counts, i.e., in the search index fields of
+`kerkoapp.citations`, in the dashboard and in the author statistics, the
+looked up `CitedBy`, `Cites` and `OpenAlex` values take precedence over those
+typed in the items' `extra` field, which remain in use for the other items.
+
+Lookups get batched, up to `batch_size` DOIs per request with OpenAlex's `doi`
+filter, and run by a pool of `workers` threads sharing one pool of HTTP
+connections, under a global `rate_limit`. Failed requests get retried with
+exponential backoff, honoring any `Retry-After` header. Progress gets saved
+every `save_interval` seconds, and when the run stops, so an interrupted run
+resumes where it stopped: DOIs looked up less than `max_age` seconds ago are
+skipped. A batch looked up again sends the ETag of its previous response, and
+a server that supports it may then answer that nothing has changed.
+
+Like the author statistics, two files are written under Kerko's data
+directory: the state of the lookups, and a smaller view of the counts found,
+by DOI, from which the app reads.
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http import HTTPStatus
+from pathlib import Path
+from typing import NamedTuple, Optional
+from urllib.parse import quote
+
+from flask import current_app
+from kerko.storage import get_storage_dir, open_index
+
+from .caching import GenerationCache
+from .config_helpers import kerkoapp_config
+from .extra import parse_extra
+from .metrics import cache_collector, register_collector
+from .storage import load_pickle, save_pickle
+
+# Bump this whenever the layout of the stored data changes, so that files
+# written by an older version get ignored instead of being misread.
+CITATIONS_STORE_VERSION = 1
+
+# Keys of the `extra` field that looked up values replace, with their key in
+# the looked up values.
+ENRICHED_KEYS = {
+    "CitedBy": "cited_by",
+    "Cites": "cites",
+    "OpenAlex": "openalex",
+}
+
+DOI_RE = re.compile(r"10\.\d{4,9}/\S+")
+
+# DOIs with these characters would break the syntax of OpenAlex's filters,
+# hence get looked up one at a time.
+UNBATCHABLE_RE = re.compile(r"[,|]")
+
+WORK_FIELDS = "id,doi,cited_by_count,referenced_works_count"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest wait between two attempts, in seconds.
+MAX_BACKOFF = 60.0
+
+# Looked up citation counts, reused until the view file changes
+citations_cache = GenerationCache("citations")
+register_collector(cache_collector("citations", citations_cache))
+
+
+class CitationLookupError(Exception):
+    """A batch of DOIs could not be looked up."""
+
+
+class Citations(NamedTuple):
+    cited_by: Optional[int]
+    cites: Optional[int]
+
+
+class Batch(NamedTuple):
+    dois: tuple
+    # ETag of the previous response to the same batch, if any.
+    etag: Optional[str] = None
+
+
+def get_state_path():
+    return Path(get_storage_dir("citations")) / "citations-state.pickle"
+
+
+def get_view_path():
+    return Path(get_storage_dir("citations")) / "citations.pickle"
+
+
+def normalize_doi(value):
+    """Return the DOI found in `value`, e.g., a DOI URL, lowercased, or `None`."""
+    m = DOI_RE.search(value or "")
+    return m.group().rstrip(".").lower() if m else None
+
+
+def get_item_doi(data):
+    return normalize_doi(data.get("DOI") or parse_extra(data.get("extra", "")).get("DOI"))
+
+
+def get_view_key():
+    try:
+        return get_view_path().stat().st_mtime_ns
+    except OSError:
+        return -1  # Cache the absence of the view as well
+
+
+def load_citations_view():
+    view = load_pickle(get_view_path())
+    if not isinstance(view, dict) or view.get("version") != CITATIONS_STORE_VERSION:
+        return None
+    return view
+
+
+def get_citations_view():
+    """Return the looked up values, or `None` if there are none yet."""
+    return citations_cache.get(get_view_key(), load_citations_view)
+
+
+def get_citations_generation():
+    """Return a number that changes each time the looked up values change."""
+    view = get_citations_view()
+    return view["generation"] if view else 0
+
+
+def get_enriched(data, view):
+    """
+    Return the looked up values of an item, by key of `ENRICHED_KEYS`, or `None`.
+
+    :param view: The looked up values, from `get_citations_view()`. Callers
+        going through many items get it once for all of them.
+    """
+    if not view:
+        return None
+    doi = get_item_doi(data)
+    return view["works"].get(doi) if doi else None
+
+
+def get_citations(data, view):
+    """
+    Return the citation counts of an item, looked up or from its `extra` field.
+
+    :param view: The looked up values, see `get_enriched()`.
+    """
+    extra = parse_extra(data.get("extra", ""))
+    values = get_enriched(data, view)
+    if values is None:
+        return Citations(extra.cited_by, extra.cites)
+    return Citations(
+        extra.cited_by if values["cited_by"] is None else values["cited_by"],
+        extra.cites if values["cites"] is None else values["cites"],
+    )
+
+
+class RateLimiter:
+    """Space out calls, across threads, to at most `rate` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(now, self._next_time)
+            self._next_time = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+    def pause(self, seconds):
+        """Delay every upcoming call by at least `seconds`, e.g., after a 429."""
+        with self._lock:
+            self._next_time = max(self._next_time, time.monotonic() + seconds)
+
+
+class CitationClient:
+    """
+    Client of an OpenAlex-compatible API, meant to be shared by threads.
+
+    `settings` is a `CitationsModel`. The `retries` counter is only
+    informative.
+    """
+
+    def __init__(self, settings):
+        # Only needed by the lookup command, not worth slowing down the app's start
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.settings = settings
+        self.limiter = RateLimiter(settings.rate_limit)
+        self.retries = 0
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        user_agent = "KerkoApp"
+        if settings.mailto:
+            user_agent += f" (mailto:{settings.mailto})"
+        self.session.headers["User-Agent"] = user_agent
+
+    def close(self):
+        self.session.close()
+
+    def lookup(self, dois, etag=None):
+        """
+        Look up a batch of DOIs.
+
+        Return a `(values, etag)` tuple, `values` being a dict of looked up
+        values by DOI, without the DOIs not found, or `None` if the response is
+        unchanged since the given `etag`.
+
+        :raise CitationLookupError: If the batch could not be looked up.
+        """
+        params = {"select": WORK_FIELDS}
+        if self.settings.mailto:
+            params["mailto"] = self.settings.mailto
+        api_url = self.settings.api_url.rstrip("/")
+        if len(dois) == 1:
+            url = f"{api_url}/works/doi:{quote(dois[0], safe='/')}"
+        else:
+            url = f"{api_url}/works"
+            params["filter"] = "doi:" + "|".join(dois)
+            params["per-page"] = len(dois)
+        response = self._get(url, params, etag)
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return None, etag
+        if response.status_code == HTTPStatus.NOT_FOUND:
+            if len(dois) == 1:
+                return {}, None  # Unknown DOI
+            msg = f"{url} returned status 404"
+            raise CitationLookupError(msg)
+        try:
+            payload = response.json()
+        except ValueError as e:
+            msg = f"Invalid response from {url}: {e}"
+            raise CitationLookupError(msg) from e
+        works = payload.get("results", []) if len(dois) > 1 else [payload]
+        values = {}
+        for work in works:
+            doi = normalize_doi(work.get("doi"))
+            if doi in dois and doi not in values:
+                values[doi] = {
+                    "cited_by": work.get("cited_by_count"),
+                    "cites": work.get("referenced_works_count"),
+                    "openalex": work.get("id"),
+                }
+        return values, response.headers.get("ETag")
+
+    def _get(self, url, params, etag):
+        headers = {"If-None-Match": etag} if etag else {}
+        attempt = 1
+        while True:
+            self.limiter.wait()
+            error = None
+            try:
+                response = self.session.get(
+                    url, params=params, headers=headers, timeout=self.settings.timeout
+                )
+            except self._requests.RequestException as e:
+                error = e
+                wait = None
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if (
+                        response.status_code >= HTTPStatus.BAD_REQUEST
+                        and response.status_code != HTTPStatus.NOT_FOUND
+                    ):
+                        msg = f"{url} returned status {response.status_code}"
+                        raise CitationLookupError(msg)
+                    return response
+                error = f"status {response.status_code}"
+                wait = parse_retry_after(response.headers.get("Retry-After"))
+                if wait is not None:
+                    # The server wants every thread to slow down
+                    self.limiter.pause(wait)
+            if attempt >= self.settings.max_attempts:
+                msg = f"{url} failed after {attempt} attempt(s): {error}"
+                raise CitationLookupError(msg)
+            if wait is None:
+                wait = self.settings.backoff * 2 ** (attempt - 1) * (0.5 + random.random())
+            self.retries += 1
+            time.sleep(min(wait, MAX_BACKOFF))
+            attempt += 1
+
+
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None  # Missing, or an HTTP date, which APIs rarely send
+
+
+def get_batch_digest(dois):
+    return hashlib.sha1("|".join(dois).encode()).hexdigest()
+
+
+def plan_batches(dois, state, batch_size, max_age, full=False):
+    """
+    Return the batches of DOIs due for a lookup.
+
+    DOIs looked up less than `max_age` seconds ago are left out, unless `full`
+    is true.
+    """
+    now = time.time()
+    due = sorted(
+        doi
+        for doi in dois
+        if full or now - state["works"].get(doi, {}).get("fetched_at", 0) >= max_age
+    )
+    batchable = [doi for doi in due if not UNBATCHABLE_RE.search(doi)]
+    groups = [tuple(batchable[i : i + batch_size]) for i in range(0, len(batchable), batch_size)]
+    groups.extend((doi,) for doi in due if UNBATCHABLE_RE.search(doi))
+    batches = []
+    for group in groups:
+        etag = None
+        # A previous response only applies if it covered the same DOIs
+        if all(doi in state["works"] for doi in group):
+            etag = state["batches"].get(get_batch_digest(group))
+        batches.append(Batch(group, etag))
+    return batches
+
+
+def lookup_batches(client, batches, on_batch):
+    """
+    Look up batches of DOIs concurrently.
+
+    `on_batch(batch, values, etag, error)` gets called from the calling thread
+    as each batch completes, `error` being the `CitationLookupError` of a
+    failed batch.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=client.settings.workers, thread_name_prefix="kerkoapp-citations"
+    )
+    try:
+        futures = {
+            executor.submit(client.lookup, batch.dois, batch.etag): batch for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                values, etag = future.result()
+            except CitationLookupError as e:
+                on_batch(batch, None, None, e)
+            else:
+                on_batch(batch, values, etag, None)
+    finally:
+        # On an interruption, leave the pending batches for the next run
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def new_state():
+    return {
+        "version": CITATIONS_STORE_VERSION,
+        # Outcome of the latest lookup of each DOI, as a dict with the time of
+        # the lookup and the values found (`None` if not found).
+        "works": {},
+        # ETag of the latest response to each batch, by digest of its DOIs.
+        "batches": {},
+    }
+
+
+def load_state():
+    state = load_pickle(get_state_path())
+    if not isinstance(state, dict) or state.get("version") != CITATIONS_STORE_VERSION:
+        return None
+    return state
+
+
+def apply_lookup(state, batch, values, etag):
+    """Record the outcome of a successful lookup."""
+    now = time.time()
+    for doi in batch.dois:
+        if values is None:
+            # Unchanged since the previous lookup
+            state["works"][doi]["fetched_at"] = now
+        else:
+            state["works"][doi] = {"fetched_at": now, "values": values.get(doi)}
+    digest = get_batch_digest(batch.dois)
+    if etag:
+        state["batches"][digest] = etag
+    else:
+        state["batches"].pop(digest, None)
+
+
+def save_view(state, dois):
+    """
+    Save the values found for the given DOIs, for the app to read.
+
+    Return whether they differ from the previously saved ones.
+    """
+    works = {}
+    for doi in sorted(dois):
+        entry = state["works"].get(doi)
+        if entry and entry["values"]:
+            works[doi] = entry["values"]
+    previous = load_citations_view()
+    if previous and previous["works"] == works:
+        return False
+    save_pickle(
+        get_view_path(),
+        {
+            "version": CITATIONS_STORE_VERSION,
+            "generation": (previous["generation"] if previous else 0) + 1,
+            "timestamp": time.time(),
+            "works": works,
+        },
+    )
+    return True
+
+
+def get_cached_dois():
+    """Return the DOIs of the items in Kerko's cache."""
+    dois = set()
+    with open_index("cache").searcher() as searcher:
+        for fields in searcher.all_stored_fields():
+            doi = get_item_doi(fields.get("data", {}))
+            if doi:
+                dois.add(doi)
+    return dois
+
+
+def update_citations(full=False):
+    """
+    Look up the DOIs of the items in Kerko's cache, and save the values found.
+
+    Return the number of batches by outcome ('found', 'unchanged', 'failed')
+    along with the number of retried requests ('retries'), and whether the
+    saved values have changed.
+
+    :raise SearchIndexError: If the cache is missing or empty.
+    """
+    settings = kerkoapp_config(current_app).citations
+    dois = get_cached_dois()
+    state = load_state() or new_state()
+    # Forget the DOIs no longer in the library
+    state["works"] = {doi: entry for doi, entry in state["works"].items() if doi in dois}
+    batches = plan_batches(dois, state, settings.batch_size, settings.max_age, full=full)
+    current_app.logger.info(
+        "Looking up %d of %d DOI(s), in %d batch(es).",
+        sum(len(b.dois) for b in batches),
+        len(dois),
+        len(batches),
+    )
+
+    outcomes = Counter()
+    start_time = last_save_time = time.monotonic()
+
+    def on_batch(batch, values, etag, error):
+        nonlocal last_save_time
+        if error:
+            outcomes["failed"] += 1
+            current_app.logger.warning("Unable to look up %d DOI(s): %s", len(batch.dois), error)
+        else:
+            outcomes["unchanged" if values is None else "found"] += 1
+            apply_lookup(state, batch, values, etag)
+        now = time.monotonic()
+        if now - last_save_time >= settings.save_interval:
+            # Save progress, for an interrupted run to resume from
+            save_pickle(get_state_path(), state)
+            last_save_time = now
+            done = sum(outcomes.values())
+            current_app.logger.info(
+                "Looked up %d of %d batch(es) (%.1f/s).",
+                done,
+                len(batches),
+                done / (now - start_time),
+            )
+
+    client = CitationClient(settings)
+    try:
+        lookup_batches(client, batches, on_batch)
+    finally:
+        client.close()
+        save_pickle(get_state_path(), state)
+    outcomes["retries"] = client.retries
+    return outcomes, save_view(state, dois)
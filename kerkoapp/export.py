@@ -0,0 +1,194 @@
+"""
+Export of every item of the library, as processed for the dashboard.
+
+The records have the fields of the dashboard's carousel cards (see
+`dashboard.process_item`), preceded by the item key. They get streamed from
+the stored fields of Kerko's cache, one item at a time, and written in chunks,
+so that exporting the whole library takes constant memory whatever its size.
+Like the dashboard statistics, the export covers the top-level items that pass
+Kerko's tag filters.
+
+The formats are CSV, JSON Lines (`ndjson`) and, if the optional `pyarrow`
+package is installed, Parquet. The export is available through
+`flask kerkoapp export` and, if `[kerkoapp.export]` enables it, at
+`/bibliography/export.<format>`, gzip-compressed for clients that accept it.
+As each request to that endpoint reads the whole library, it is disabled by
+default.
+"""
+
+import csv
+import importlib.util
+import io
+import itertools
+import time
+import zlib
+
+from flask import Blueprint, abort, current_app, request, stream_with_context
+from kerko.shortcuts import config
+from kerko.storage import SearchIndexError
+from kerko.tags import TagGate
+from werkzeug.wrappers import Response
+
+from .config_helpers import kerkoapp_config
+from .dashboard import iter_whoosh_items, process_item
+from .enrichment import get_citations_view
+from .json_responses import dumps
+
+export_bp = Blueprint("export", __name__)
+
+EXPORT_FIELDS = ("key", "title", "date", "doi", "url", "creators", "cited_by", "cites")
+
+# Media type and whether the format gets compressed on the fly, by format.
+EXPORT_FORMATS = {
+    "csv": ("text/csv", True),
+    "ndjson": ("application/x-ndjson", True),
+    # Parquet compresses its own pages
+    "parquet": ("application/vnd.apache.parquet", False),
+}
+
+# Rows per row group of Parquet files.
+PARQUET_ROW_GROUP_SIZE = 10_000
+
+
+def is_format_available(fmt):
+    if fmt == "parquet":
+        # Not imported until needed, for it takes long to import
+        return importlib.util.find_spec("pyarrow") is not None
+    return fmt in EXPORT_FORMATS
+
+
+def iter_export_records():
+    """Yield the record of each item, one at a time."""
+    gate = TagGate(config("kerko.zotero.item_include_re"), config("kerko.zotero.item_exclude_re"))
+    citations_view = get_citations_view()
+    for item in iter_whoosh_items():
+        data = item.get("data", {})
+        if item.get("parentItem") or not gate.check(data):
+            continue
+        yield {"key": item.get("key", data.get("key", "")), **process_item(item, citations_view)}
+
+
+def iter_chunks(records, chunk_size):
+    """Group the records into lists of at most `chunk_size` records."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(records, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in iter_chunks(records, chunk_size):
+        writer.writerows([record[field] for field in EXPORT_FIELDS] for record in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # Header of an empty export
+
+
+def iter_ndjson(records, chunk_size):
+    for chunk in iter_chunks(records, chunk_size):
+        yield b"".join(dumps(record) + b"\n" for record in chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file that hands over what gets written to it, for streaming."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet's footer refers to offsets from the start of the file
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(records, chunk_size):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(field, pa.string()) for field in EXPORT_FIELDS[:6]]
+        + [("cited_by", pa.int64()), ("cites", pa.int64())]
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        rows_per_group = max(chunk_size, PARQUET_ROW_GROUP_SIZE)
+        for chunk in iter_chunks(records, rows_per_group):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_export(fmt, records=None, chunk_size=None):
+    """Yield the export in the given format, as chunks of bytes."""
+    if records is None:
+        records = iter_export_records()
+    if chunk_size is None:
+        chunk_size = kerkoapp_config(current_app).export.chunk_size
+    writers = {"csv": iter_csv, "ndjson": iter_ndjson, "parquet": iter_parquet}
+    for data in writers[fmt](records, chunk_size):
+        if data:
+            yield data
+
+
+def iter_gzip(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def get_export_filename(fmt):
+    return f"library-{time.strftime('%Y%m%d')}.{fmt}"
+
+
+@export_bp.route("/export.<fmt>")
+def export(fmt):
+    if not kerkoapp_config(current_app).export.enabled or fmt not in EXPORT_FORMATS:
+        abort(404)
+    if not is_format_available(fmt):
+        abort(501)
+    mimetype, compressible = EXPORT_FORMATS[fmt]
+    chunks = iter_export(fmt)
+    try:
+        # Fail before the response starts if the cache cannot be read
+        first_chunk = next(chunks, b"")
+    except SearchIndexError:
+        current_app.logger.exception("Unable to export the library.")
+        abort(503)
+    chunks = itertools.chain([first_chunk], chunks)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{get_export_filename(fmt)}"',
+        "Cache-Control": "no-store",
+        # Keep proxies such as nginx from buffering the whole response
+        "X-Accel-Buffering": "no",
+    }
+    if compressible:
+        headers["Vary"] = "Accept-Encoding"
+        if request.accept_encodings["gzip"]:
+            chunks = iter_gzip(chunks)
+            headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
@@ -7,5 +7,8 @@ Each extension is initialized by the create_app factory of the app module.
 from flask_babel import Babel
 from flask_bootstrap import Bootstrap4
 
+from .indexes import IndexManager
+
 babel = Babel()
 bootstrap = Bootstrap4()
+indexes = IndexManager()
@@ -0,0 +1,87 @@
+"""
+Parse the key/value metadata that Zotero items carry in their `extra` field.
+
+The field typically looks like `CitedBy: 12, Cites: 40, OpenAlex: <url>`, with
+pairs separated by commas or line breaks. Items exported from Lens.org carry a
+`Citation Key Alias` instead, whose first line is a link to the Lens record.
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Maximum number of distinct `extra` strings whose parsed value is memoized.
+PARSE_CACHE_SIZE = 4096
+
+# A pair is any run of characters up to the next comma or line break. This
+# pattern cannot backtrack, so matching takes linear time.
+PAIR_RE = re.compile(r"[^,\n]+")
+
+
+class Extra(NamedTuple):
+    """The parsed content of an `extra` field. Instances are immutable."""
+
+    pairs: tuple[tuple[str, str], ...]
+    lenslink: Optional[str] = None
+    cited_by: Optional[int] = None
+    cites: Optional[int] = None
+
+    def get(self, key, default=None):
+        """Return the value of the given key, like `as_dict().get()` would."""
+        if self.lenslink is not None:
+            return self.lenslink if key == "lenslink" else default
+        for k, v in self.pairs:
+            if k == key:
+                return v
+        return default
+
+    def as_dict(self):
+        """
+        Return the pairs as a new dict.
+
+        Items that have a `Citation Key Alias` only get a `lenslink` key, all
+        other pairs being dropped.
+        """
+        if self.lenslink is not None:
+            return {"lenslink": self.lenslink}
+        return dict(self.pairs)
+
+
+def _to_int(value):
+    # Unlike `isdigit()`, `isdecimal()` rejects what `int()` does, e.g. "²"
+    if value is not None and value.isdecimal():
+        return int(value)
+    return None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_extra(text):
+    """
+    Parse the content of an `extra` field into an `Extra` record.
+
+    The text is scanned once, splitting pairs on commas and line breaks, and
+    keys from values on the first colon of each pair. This takes linear time
+    whatever the input. Pairs that lack a colon are ignored.
+
+    Results are memoized, keyed by the input string.
+    """
+    pairs = {}
+    alias = None
+    for match in PAIR_RE.finditer(text or ""):
+        key, colon, value = match.group().partition(":")
+        key = key.strip()
+        value = value.strip()
+        if not colon or not key or not value:
+            continue
+        if key == "Citation Key Alias":
+            alias = alias if alias is not None else value
+        else:
+            pairs[key] = value
+
+    if alias is not None:
+        return Extra(pairs=tuple(pairs.items()), lenslink=alias)
+    return Extra(
+        pairs=tuple(pairs.items()),
+        cited_by=_to_int(pairs.get("CitedBy")),
+        cites=_to_int(pairs.get("Cites")),
+    )
@@ -0,0 +1,201 @@
+"""
+HTTP caching of KerkoApp's own pages.
+
+Pages decorated with `cached_page` get a strong ETag derived from the data they
+show (typically the index generation) and from the current locale. Requests
+whose `If-None-Match` header matches get a 304 response without any rendering.
+Rendered pages may also be kept in memory, so that they get rendered only once
+per index update and locale. Responses that depend on query string arguments
+get an ETag too, but are not kept in memory.
+
+Under ASGI, requests for which `find_cached_answer` finds an answer get handled
+right in the event loop, sparing them a trip through the thread pool (see
+`kerkoapp.asgi`). The answer found gets passed to the view in the request's
+environ, under `CACHED_ANSWER_KEY`, and served even if the page has gone stale
+since, so that the event loop never renders a page.
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import os
+import threading
+from functools import wraps
+from pathlib import Path
+
+from flask import Flask, current_app, g, make_response, request
+from flask_babel import get_locale
+from werkzeug.wrappers import Response
+
+from .config_helpers import kerkoapp_config
+
+# Environ key of the answer found by `find_cached_answer`, for the view to serve.
+CACHED_ANSWER_KEY = "kerkoapp.cached_answer"
+
+# Rendered pages, by (endpoint, locale). Only the latest version is kept.
+_pages = {}
+_pages_lock = threading.Lock()
+
+# Counters of the current process, guarded by `_stats_lock`, see `get_stats`.
+stats = {
+    "hits": 0,
+    "misses": 0,
+    "not_modified": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _reset_stats_after_fork():
+    # Like `metrics.Registry`, a forked process counts from zero
+    global _stats_lock  # noqa: PLW0603
+    _stats_lock = threading.Lock()
+    for event in stats:
+        stats[event] = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_stats_after_fork)
+
+
+def count(event: str) -> None:
+    with _stats_lock:
+        stats[event] += 1
+
+
+def get_stats() -> dict:
+    """Return a copy of the counters of the pages served."""
+    with _stats_lock:
+        return dict(stats)
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["kerkoapp_http_caching"] = {
+        "deployment": get_deployment_fingerprint(app),
+    }
+
+
+def get_deployment_fingerprint(app: Flask) -> str:
+    """
+    Return a digest of what, besides the data, affects how pages render.
+
+    This covers the Kerko version, KerkoApp's templates, and Kerko's
+    configuration, all of which only change with a restart. It is the same for
+    all processes of a deployment, so that ETags remain valid across workers.
+    """
+    try:
+        kerko_version = importlib.metadata.version("kerko")
+    except importlib.metadata.PackageNotFoundError:
+        kerko_version = ""
+    template_dir = Path(app.root_path) / (app.template_folder or "templates")
+    template_mtimes = sorted(
+        (str(p.relative_to(template_dir)), p.stat().st_mtime_ns)
+        for p in template_dir.rglob("*")
+        if p.is_file()
+    )
+    digest = hashlib.sha1()
+    digest.update(kerko_version.encode())
+    digest.update(json.dumps(template_mtimes).encode())
+    digest.update(json.dumps(app.config.get("kerko"), sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def skip_cache() -> None:
+    """Prevent the page being rendered from getting cached, e.g., on errors."""
+    g.kerkoapp_skip_page_cache = True
+
+
+def make_etag(endpoint: str, locale: str, version, args=()) -> str:
+    deployment = current_app.extensions["kerkoapp_http_caching"]["deployment"]
+    digest = hashlib.sha1()
+    digest.update(json.dumps([deployment, endpoint, locale, version, args], default=str).encode())
+    return digest.hexdigest()
+
+
+def get_page_state(settings, get_version):
+    """Return the page's ETag, its key, and whether it may be kept in memory."""
+    locale = str(get_locale())
+    query_args = sorted(request.args.items(multi=True))
+    etag = make_etag(request.endpoint, locale, get_version(), query_args)
+    page_key = (request.endpoint, locale)
+    # There is a single slot per endpoint and locale, which would get
+    # thrashed by arbitrary query strings.
+    memory = settings.memory and not query_args
+    return etag, page_key, memory
+
+
+def find_cached_answer(view):
+    """
+    Return how the current request would get answered without rendering, or `None`.
+
+    That is, with a 304 response or with a page kept in memory. `view` is the
+    view function matching the request, as registered on the app. This must be
+    called within the request's context. A request whose environ holds the
+    answer under `CACHED_ANSWER_KEY` gets served with it.
+    """
+    find_cached = getattr(view, "kerkoapp_find_cached", None)
+    if find_cached is not None:
+        # The view keeps its own cache, e.g., `kerkoapp.search_cache`
+        return find_cached()
+    get_version = getattr(view, "kerkoapp_page_version", None)
+    if get_version is None:
+        return None
+    settings = kerkoapp_config(current_app).http_cache
+    if not settings.enabled:
+        return None
+    etag, page_key, memory = get_page_state(settings, get_version)
+    if etag in request.if_none_match:
+        return etag, None
+    page = _pages.get(page_key) if memory else None
+    return (etag, page) if page and page[0] == etag else None
+
+
+def cached_page(get_version):
+    """
+    Make a view cacheable, based on the version of the data it renders.
+
+    :param callable get_version: Return a JSON-serializable value that changes
+        whenever the page's content does, e.g., the index generation. It gets
+        called on every request, so it must be cheap.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            settings = kerkoapp_config(current_app).http_cache
+            if not settings.enabled:
+                return view(*args, **kwargs)
+
+            answer = request.environ.get(CACHED_ANSWER_KEY)
+            if answer is None:
+                etag, page_key, memory = get_page_state(settings, get_version)
+                page = _pages.get(page_key) if memory else None
+            else:
+                etag, page = answer
+            if etag in request.if_none_match:
+                count("not_modified")
+                response = Response(status=304)
+            elif page and page[0] == etag:
+                count("hits")
+                response = Response(page[1], mimetype=page[2])
+            else:
+                # Never reached with an answer found beforehand, which always
+                # gets served, stale or not
+                count("misses")
+                response = make_response(view(*args, **kwargs))
+                if g.get("kerkoapp_skip_page_cache") or response.status_code != 200:  # noqa: PLR2004
+                    return response
+                if memory:
+                    with _pages_lock:
+                        _pages[page_key] = (etag, response.get_data(), response.mimetype)
+
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = settings.max_age
+            response.cache_control.s_maxage = settings.shared_max_age
+            response.vary.add("Accept-Language")
+            return response
+
+        wrapper.kerkoapp_page_version = get_version
+        return wrapper
+
+    return decorator
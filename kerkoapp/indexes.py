@@ -0,0 +1,145 @@
+"""
+Long-lived access to the Whoosh indexes, shared by all requests of a process.
+"""
+
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import whoosh.index
+from kerko.storage import SearchIndexError, get_storage_dir
+
+from .caching import get_index_version
+from .metrics import timed
+
+
+def get_whoosh_dir(storage):
+    """Return the directory of one of Kerko's Whoosh indexes, 'cache' or 'index'."""
+    return Path(get_storage_dir(storage)) / "whoosh"
+
+
+class IndexManager:
+    """
+    Keep Whoosh indexes and searchers open across requests.
+
+    Each index is opened once per process. Each thread gets its own searcher
+    (Whoosh searchers are not meant to be shared between threads), which is
+    reused until the index's generation changes on disk. The generation is
+    checked at most once every `refresh_interval` seconds, by listing the
+    index directory. A stale searcher gets refreshed, which reopens only the
+    segments that have changed, unless the index has been recreated since,
+    in which case the index gets opened again.
+
+    All searchers are closed when the process exits. A process forked
+    afterwards, e.g., a gunicorn worker when the app is preloaded, forgets the
+    indexes and searchers of its parent and opens its own.
+    """
+
+    def __init__(self, app=None, refresh_interval=1.0):
+        self.refresh_interval = refresh_interval
+        self._reset_after_fork()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def _reset_after_fork(self):
+        # Whoosh file handles must not be shared with the parent, whose
+        # searchers are left for it to close
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._indexes = {}
+        self._searchers = []
+
+    def init_app(self, app):
+        app.extensions["kerkoapp_indexes"] = self
+        atexit.register(self.close)
+
+    @contextmanager
+    def searcher(self, index_dir):
+        """
+        Provide the current thread's searcher on the index in `index_dir`.
+
+        The searcher must not be closed nor kept beyond the `with` block.
+
+        :raise SearchIndexError: If there is no index in the directory.
+        """
+        with timed("index_open"):
+            searcher = self._get_searcher(str(index_dir))
+        yield searcher
+
+    def doc_count(self, index_dir):
+        """Return the number of documents in the index in `index_dir`."""
+        with self.searcher(index_dir) as searcher:
+            return searcher.doc_count()
+
+    def close(self):
+        """Close every searcher opened by this manager, in any thread."""
+        with self._lock:
+            for searcher in self._searchers:
+                if not searcher.is_closed:
+                    searcher.close()
+            self._searchers = []
+            self._indexes = {}
+        self._local = threading.local()
+
+    def _get_index(self, index_dir):
+        with self._lock:
+            if index_dir not in self._indexes:
+                try:
+                    self._indexes[index_dir] = whoosh.index.open_dir(index_dir, readonly=True)
+                except (OSError, whoosh.index.IndexError) as e:
+                    msg = f"Could not open index from directory '{index_dir}': '{e}'."
+                    raise SearchIndexError(msg) from e
+            return self._indexes[index_dir]
+
+    def _get_searcher(self, index_dir):
+        entries = self._local.__dict__.setdefault("entries", {})
+        entry = entries.get(index_dir)
+        now = time.monotonic()
+        if entry and now - entry["checked_at"] < self.refresh_interval:
+            return entry["searcher"]
+
+        version = get_index_version(index_dir)
+        if version is None:
+            # The index is gone, e.g., cleaned before a new sync.
+            self._discard(index_dir, entries)
+            msg = f"Could not open index from directory '{index_dir}'."
+            raise SearchIndexError(msg)
+
+        if (
+            entry is not None
+            and entry["version"] != version
+            and version[0] <= entry["searcher"].reader().generation()
+        ):
+            # Recreated, e.g., cleaned then synced again between two checks,
+            # its generation numbers having started over
+            self._discard(index_dir, entries)
+            entry = None
+        if entry is None:
+            searcher = self._get_index(index_dir).searcher()
+            self._track(searcher)
+        elif entry["version"] != version:
+            # The refreshed searcher reuses the readers of unchanged segments,
+            # and closes the other resources of the previous searcher.
+            searcher = entry["searcher"].refresh()
+            self._track(searcher)
+        else:
+            searcher = entry["searcher"]
+        entries[index_dir] = {"searcher": searcher, "checked_at": now, "version": version}
+        return searcher
+
+    def _track(self, searcher):
+        with self._lock:
+            self._searchers = [s for s in self._searchers if not s.is_closed]
+            self._searchers.append(searcher)
+
+    def _discard(self, index_dir, entries):
+        entry = entries.pop(index_dir, None)
+        if entry and not entry["searcher"].is_closed:
+            entry["searcher"].close()
+        with self._lock:
+            self._indexes.pop(index_dir, None)
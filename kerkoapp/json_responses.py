@@ -0,0 +1,26 @@
+"""
+Compact JSON responses for KerkoApp's API endpoints.
+
+If the optional `orjson` package is installed, it is used to serialize the
+data, which is notably faster than the standard library on large payloads.
+"""
+
+import json
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """Serialize `data` to compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def json_response(data, status: int = 200) -> Response:
+    return Response(dumps(data), status=status, mimetype="application/json")
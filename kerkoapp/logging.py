@@ -1,7 +1,19 @@
+import atexit
 import logging
+import os
+import queue
+import threading
+import weakref
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
 from flask.logging import default_handler
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
 # Set root logger to log to sys.stderr.
 # Note: this must be set before the Flask app gets created.
 dictConfig(
@@ -24,8 +36,142 @@ dictConfig(
 )
 
 
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler that several processes may share, e.g., gunicorn workers.
+
+    Each write, and the rotation it may trigger, happens under an exclusive
+    lock on a companion `.lock` file. A process whose file got rotated by
+    another process reopens it before writing. On platforms without `fcntl`,
+    this behaves like a plain `RotatingFileHandler`.
+    """
+
+    def __init__(self, filename, **kwargs):
+        kwargs.setdefault("delay", True)
+        super().__init__(filename, **kwargs)
+        self.lock_filename = f"{self.baseFilename}.lock"
+
+    def emit(self, record):
+        if fcntl is None:
+            super().emit(record)
+            return
+        try:
+            with open(self.lock_filename, "a") as lock_file:  # noqa: PTH123
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._reopen_if_rotated()
+                    super().emit(record)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception:  # noqa: BLE001
+            self.handleError(record)
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino  # noqa: PTH116
+        except OSError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = None  # Reopened on the next write.
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room in a full queue, rather than failing to stop
+        self.queue.put(self._sentinel)
+
+
+class AsyncLogHandler(QueueHandler):
+    """
+    Hand log records over to a background thread, which passes them to `handlers`.
+
+    Records wait in a queue of at most `queue_size` records. When the queue is
+    full, new records get dropped (and counted in `dropped`), unless `block` is
+    true, in which case the logging call waits for room in the queue.
+
+    The thread gets started on the first record, and again in each process
+    forked afterwards, e.g., in gunicorn workers when the app is preloaded.
+    Records still queued get written when the process exits.
+    """
+
+    # Every instance, for reporting the dropped records
+    instances = weakref.WeakSet()
+
+    def __init__(self, handlers, queue_size=10_000, block=False):
+        self.instances.add(self)
+        self.target_handlers = list(handlers)
+        self.queue_size = queue_size
+        self.block = block
+        self.dropped = 0
+        super().__init__(queue.Queue(queue_size))
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.stop)
+
+    def _reset(self):
+        # Threads do not survive a fork, and the queue may hold the parent's
+        # records or locks
+        self.queue = queue.Queue(self.queue_size)
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._listener is None:
+                self._listener = _Listener(
+                    self.queue, *self.target_handlers, respect_handler_level=True
+                )
+                self._listener.start()
+
+    def stop(self):
+        """Write the records still queued, and stop the thread."""
+        with self._start_lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def close(self):
+        self.stop()
+        for handler in self.target_handlers:
+            handler.close()
+        super().close()
+
+    def enqueue(self, record):
+        if self._listener is None:
+            self.start()
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def make_async(app, handlers):
+    """Return a handler that passes records to `handlers` from a background thread."""
+    from .config_helpers import kerkoapp_config
+
+    settings = kerkoapp_config(app).logging
+    return AsyncLogHandler(
+        handlers,
+        queue_size=settings.queue_size,
+        block=settings.when_full == "block",
+    )
+
+
 def init_app(app):
     root = logging.getLogger()
+    # Move the root logger's handlers to a background thread too
+    handlers = [h for h in root.handlers if not isinstance(h, AsyncLogHandler)]
+    if handlers:
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(make_async(app, handlers))
     if app.config.get("LOGGING_HANDLER") == "syslog":
         from logging.handlers import SysLogHandler
 
@@ -37,7 +183,7 @@ def init_app(app):
                 )
             )
         )
-        root.addHandler(syslog_handler)
+        root.addHandler(make_async(app, [syslog_handler]))
     if "LOGGING_LEVEL" in app.config:
         default_handler.setLevel(app.config["LOGGING_LEVEL"])
         app.logger.setLevel(app.config["LOGGING_LEVEL"])
@@ -0,0 +1,454 @@
+"""
+Request timing and metrics, exposed in the Prometheus text format.
+
+Each process records its own counters and histograms in memory: the latency
+and status of every request, by endpoint, and the duration of the phases that
+views report with `timed()`. Every so often, after a request, a process dumps
+them to its own file in `instance/metrics/`. The `/metrics` endpoint, whichever
+process serves it, sums the files of all processes, so that the numbers cover
+every gunicorn worker. The files of processes that have exited get folded into
+a single archive file, so that their counts are not lost.
+
+Optionally, each request also gets logged as a JSON line in
+`instance/logs/access.log`.
+
+Requests whose environ has a true `UNRECORDED_KEY`, such as those of
+`kerkoapp.warmup`, are neither timed nor logged, and neither are the phases of
+their views.
+
+Metrics are disabled unless `[kerkoapp.metrics]` enables them. The endpoint
+itself is not access controlled, which is up to the reverse proxy.
+"""
+
+import functools
+import json
+import logging as py_logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import Flask, Response, has_request_context, request
+from werkzeug.wsgi import ClosingIterator
+
+from .config_helpers import kerkoapp_config
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "kerkoapp_http_requests_total": ("counter", "Requests, by endpoint, method and status."),
+    "kerkoapp_http_request_duration_seconds": ("histogram", "Request latency, by endpoint."),
+    "kerkoapp_phase_duration_seconds": ("histogram", "Duration of the phases of views."),
+    "kerkoapp_cache_events_total": ("counter", "Cache hits, misses and other events."),
+    "kerkoapp_cache_rebuild_seconds_total": ("counter", "Time spent computing cached values."),
+    "kerkoapp_log_records_dropped_total": ("counter", "Log records dropped on a full queue."),
+    "kerkoapp_profiles_written_total": ("counter", "Profiles of slow or sampled requests written."),
+}
+
+ARCHIVE_FILENAME = "archived.json"
+
+# Environ key marking internal requests to keep out of the metrics.
+UNRECORDED_KEY = "kerkoapp.unrecorded"
+
+
+class Registry:
+    """
+    Counters and histograms of the current process.
+
+    A process forked afterwards starts counting from zero, lest the parent's
+    metrics get counted again by each of its children.
+    """
+
+    def __init__(self):
+        # Callables returning extra counter values, as (name, labels, value)
+        self.collectors = []
+        self._reset_after_fork()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Bucket counts (non-cumulative), then sum and count
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(BUCKETS)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        """Return the metrics as JSON-serializable data."""
+        with self._lock:
+            counters = [
+                [name, list(labels), value] for (name, labels), value in self.counters.items()
+            ]
+            histograms = [
+                [name, list(labels), list(values)]
+                for (name, labels), values in self.histograms.items()
+            ]
+        for collect in self.collectors:
+            try:
+                samples = list(collect())
+            except Exception:  # noqa: BLE001
+                continue  # Metrics must never break requests
+            for name, labels, value in samples:
+                counters.append([name, sorted(labels.items()), value])
+        return {"counters": counters, "histograms": histograms}
+
+
+registry = Registry()
+
+
+def register_collector(collect):
+    """
+    Register a callable that returns counter values read from elsewhere.
+
+    It must return an iterable of `(name, labels, value)` tuples, `labels`
+    being a dict. Such values are collected each time metrics get dumped.
+    """
+    registry.collectors.append(collect)
+
+
+def cache_collector(name, cache):
+    """
+    Return a collector of the counters of a cache.
+
+    `cache` may be a `GenerationCache`, a `BackgroundRefreshCache`, or any
+    object whose `stats()` method returns a dict of counters.
+    """
+
+    def collect():
+        for event, value in cache.stats().items():
+            if event == "rebuild_seconds":
+                yield "kerkoapp_cache_rebuild_seconds_total", {"cache": name}, value
+            elif not event.endswith("_seconds"):
+                yield "kerkoapp_cache_events_total", {"cache": name, "event": event}, value
+
+    return collect
+
+
+@contextmanager
+def timed(phase):
+    """Record how long the `with` block takes, as a phase of the current view."""
+    if has_request_context() and request.environ.get(UNRECORDED_KEY):
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(
+            "kerkoapp_phase_duration_seconds",
+            {"phase": phase},
+            time.perf_counter() - start_time,
+        )
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware that times every request.
+
+    The time runs until the response has been fully sent, and the endpoint
+    label comes from Flask's URL matching.
+    """
+
+    def __init__(self, wsgi_app, app, access_logger=None):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.access_logger = access_logger
+
+    def __call__(self, environ, start_response):
+        if environ.get(UNRECORDED_KEY):
+            return self.wsgi_app(environ, start_response)
+        start_time = time.perf_counter()
+        status = []
+
+        def _start_response(status_line, headers, exc_info=None):
+            status.append(status_line.split(" ", 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        except Exception:
+            status.append("500")
+            self.record(environ, status, start_time)
+            raise
+        return ClosingIterator(body, lambda: self.record(environ, status, start_time))
+
+    def record(self, environ, status, start_time):
+        elapsed = time.perf_counter() - start_time
+        endpoint = environ.get("kerkoapp.endpoint") or "unknown"
+        method = environ.get("REQUEST_METHOD", "")
+        status_code = status[-1] if status else "500"
+        registry.inc(
+            "kerkoapp_http_requests_total",
+            {"endpoint": endpoint, "method": method, "status": status_code},
+        )
+        registry.observe("kerkoapp_http_request_duration_seconds", {"endpoint": endpoint}, elapsed)
+        if self.access_logger:
+            self.access_logger.info(
+                json.dumps(
+                    {
+                        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                        "method": method,
+                        "path": environ.get("PATH_INFO", ""),
+                        "query": environ.get("QUERY_STRING", ""),
+                        "endpoint": endpoint,
+                        "status": int(status_code),
+                        "duration_ms": round(elapsed * 1000, 3),
+                        "remote_addr": environ.get("REMOTE_ADDR", ""),
+                        "user_agent": environ.get("HTTP_USER_AGENT", ""),
+                    }
+                )
+            )
+        dumper = self.app.extensions.get("kerkoapp_metrics")
+        if dumper:
+            dumper.dump_if_due()
+
+
+class MetricsDumper:
+    """Write the metrics of the current process to its file in `directory`."""
+
+    def __init__(self, directory, interval):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._dumped_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self.directory / f"{os.getpid()}.json"
+
+    def dump_if_due(self):
+        if time.monotonic() - self._dumped_at >= self.interval:
+            self.dump()
+
+    def dump(self):
+        with self._lock:
+            self._dumped_at = time.monotonic()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.path
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(registry.snapshot()))
+            tmp_path.replace(path)
+
+    def collect(self):
+        """Return the metrics of all processes, summed."""
+        self.dump()
+        with self._exclusive_lock():
+            self._archive_exited()
+            totals = {"counters": {}, "histograms": {}}
+            for path in self.directory.glob("*.json"):
+                merge(totals, read_metrics(path))
+        return totals
+
+    def _archive_exited(self):
+        # Fold the files of exited processes into the archive
+        exited = [
+            path
+            for path in self.directory.glob("*.json")
+            if path.stem.isdigit() and not pid_exists(int(path.stem))
+        ]
+        if not exited:
+            return
+        archive_path = self.directory / ARCHIVE_FILENAME
+        archive = {"counters": {}, "histograms": {}}
+        for path in [archive_path, *exited]:
+            merge(archive, read_metrics(path))
+        tmp_path = archive_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "counters": [
+                        [name, list(labels), value]
+                        for (name, labels), value in archive["counters"].items()
+                    ],
+                    "histograms": [
+                        [name, list(labels), values]
+                        for (name, labels), values in archive["histograms"].items()
+                    ],
+                }
+            )
+        )
+        tmp_path.replace(archive_path)
+        for path in exited:
+            path.unlink(missing_ok=True)
+
+    @contextmanager
+    def _exclusive_lock(self):
+        if fcntl is None:
+            yield
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with (self.directory / ".lock").open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_metrics(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def merge(totals, metrics):
+    for name, labels, value in metrics.get("counters", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        totals["counters"][key] = totals["counters"].get(key, 0) + value
+    for name, labels, values in metrics.get("histograms", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        current = totals["histograms"].get(key)
+        totals["histograms"][key] = (
+            [a + b for a, b in zip(current, values)] if current else list(values)
+        )
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_metrics(totals):
+    """Return the metrics in the Prometheus text exposition format."""
+    lines = []
+    described = set()
+
+    def describe(name, default_type):
+        if name not in described:
+            described.add(name)
+            metric_type, help_text = HELP.get(name, (default_type, name.replace("_", " ")))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+    for (name, labels), value in sorted(totals["counters"].items()):
+        describe(name, "counter")
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    for (name, labels), values in sorted(totals["histograms"].items()):
+        describe(name, "histogram")
+        cumulative = 0
+        for bound, count in zip([*BUCKETS, "+Inf"], values):
+            cumulative += count
+            bucket_labels = format_labels((*labels, ("le", str(bound))))
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {values[-2]}")
+        lines.append(f"{name}_count{format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+@functools.cache
+def register_default_collectors():
+    # Cached, hence called only once per process
+
+    from . import http_caching
+    from .extra import parse_extra
+    from .logging import AsyncLogHandler
+
+    def collect():
+        info = parse_extra.cache_info()
+        yield "kerkoapp_cache_events_total", {"cache": "parse_extra", "event": "hits"}, info.hits
+        yield (
+            "kerkoapp_cache_events_total",
+            {"cache": "parse_extra", "event": "misses"},
+            info.misses,
+        )
+        for event, value in http_caching.get_stats().items():
+            yield "kerkoapp_cache_events_total", {"cache": "http_pages", "event": event}, value
+        yield (
+            "kerkoapp_log_records_dropped_total",
+            {},
+            sum(handler.dropped for handler in AsyncLogHandler.instances),
+        )
+
+    register_collector(collect)
+
+
+def init_app(app: Flask) -> None:
+    settings = kerkoapp_config(app).metrics
+    if not settings.enabled:
+        return
+    register_default_collectors()
+    dumper = MetricsDumper(Path(app.instance_path) / "metrics", settings.dump_interval)
+    app.extensions["kerkoapp_metrics"] = dumper
+
+    @app.before_request
+    def _record_endpoint():
+        request.environ["kerkoapp.endpoint"] = request.endpoint
+
+    def metrics_view():
+        return Response(
+            render_metrics(dumper.collect()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+            headers={"Cache-Control": "no-store"},
+        )
+
+    app.add_url_rule(settings.path, "metrics", metrics_view)
+    app.wsgi_app = MetricsMiddleware(
+        app.wsgi_app,
+        app,
+        access_logger=get_access_logger(app) if settings.access_log else None,
+    )
+
+
+def get_access_logger(app):
+    from . import logging as kerkoapp_logging
+
+    # Plain JSON lines, kept out of the app's own log
+    access_logger = py_logging.getLogger("kerkoapp.access")
+    access_logger.propagate = False
+    access_logger.setLevel(py_logging.INFO)
+    for handler in list(access_logger.handlers):
+        access_logger.removeHandler(handler)
+        handler.close()
+    log_dir = Path(app.instance_path) / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    settings = kerkoapp_config(app).logging
+    file_handler = kerkoapp_logging.SharedRotatingFileHandler(
+        log_dir / "access.log",
+        maxBytes=settings.max_bytes,
+        backupCount=settings.backup_count,
+    )
+    file_handler.setFormatter(py_logging.Formatter("%(message)s"))
+    access_logger.addHandler(kerkoapp_logging.make_async(app, [file_handler]))
+    return access_logger
@@ -0,0 +1,81 @@
+"""
+Support for preloading the app in the master process of a preforking server.
+
+With gunicorn's `--preload` option, `wsgi.py` gets imported once, in the master
+process, and the workers get forked from it. The state that does not change
+while the app runs, i.e., the parsed configuration, the Composer, the compiled
+templates, the translations and the dashboard and author snapshots, then gets
+built once and shared by every worker through copy-on-write memory, instead of
+being built again by each of them.
+
+Resources tied to a process are never shared: Whoosh searchers, the log
+listener thread and the profiler thread get opened lazily, by each worker,
+after the fork. The objects holding them reset themselves in forked children,
+through `os.register_at_fork()`.
+
+See `gunicorn.conf.py` for the server hooks calling `warm_up()` and `freeze()`.
+"""
+
+import gc
+import time
+
+import flask_babel
+from flask import Flask
+from jinja2 import TemplateError
+from kerko.config_helpers import config_get
+
+
+def get_preloaded_templates(app: Flask):
+    """Return the names of the templates worth compiling before serving."""
+    names = set(config_get(app.config, "kerko.templates").values())
+    if app.jinja_loader is not None:
+        names.update(app.jinja_loader.list_templates())
+    return sorted(names)
+
+
+def compile_template(app: Flask, name: str) -> bool:
+    """Compile a template into the Jinja environment's cache, and return whether it worked."""
+    try:
+        app.jinja_env.get_template(name)
+    except TemplateError as e:
+        app.logger.warning("Unable to compile template %s: %s", name, e)
+        return False
+    return True
+
+
+def warm_up(app: Flask) -> None:
+    """
+    Build the app's immutable state ahead of the first request.
+
+    Nothing gets computed from the search index here, so that no searcher gets
+    opened in the process. A missing snapshot thus gets computed on the first
+    dashboard request, as usual.
+    """
+    from .authors import get_authors_view
+    from .dashboard import preload_dashboard_stats
+
+    start_time = time.perf_counter()
+    templates = sum(compile_template(app, name) for name in get_preloaded_templates(app))
+    with app.test_request_context():
+        flask_babel.get_translations()
+        dashboard = preload_dashboard_stats()
+        authors = get_authors_view() is not None
+    app.logger.info(
+        "Preloaded %d template(s), dashboard snapshot: %s, author statistics: %s, in %.0f ms",
+        templates,
+        dashboard,
+        authors,
+        (time.perf_counter() - start_time) * 1000,
+    )
+
+
+def freeze() -> None:
+    """
+    Exclude every object created so far from garbage collection.
+
+    Called just before forking, this keeps the collector of each child from
+    writing to the memory pages of objects inherited from the parent, which
+    would copy those pages into the child.
+    """
+    gc.collect()
+    gc.freeze()
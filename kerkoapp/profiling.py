@@ -0,0 +1,210 @@
+"""
+Opt-in profiling of slow or sampled requests, for production use.
+
+Two kinds of profiles get written to `instance/profiles/`:
+
+- While profiling is enabled, a background thread samples the stacks of the
+  threads serving requests, every `interval` seconds. A request that turns out
+  to be slower than `slow_threshold` gets its samples written as a `.folded`
+  file, one `frame;frame;frame count` line per distinct stack, as read by
+  flame graph tools such as speedscope or `flamegraph.pl`. Sampling costs
+  little, hence can watch every request.
+
+- A random share of the requests, set by `sample_rate`, gets run under
+  cProfile instead, whatever its duration. The resulting `.prof` file can be
+  read with `python -m pstats` or snakeviz.
+
+The oldest profiles get deleted to keep at most `max_files` files, and
+`max_bytes` bytes, in the directory. Requests that `kerkoapp.metrics` leaves
+unrecorded, such as those of the warm-up, do not get profiled.
+"""
+
+import cProfile
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from flask import Flask, request
+from werkzeug.wsgi import ClosingIterator
+
+from .config_helpers import kerkoapp_config
+from .metrics import UNRECORDED_KEY, registry
+
+PROFILE_SUFFIXES = (".folded", ".prof")
+
+
+class StackSampler:
+    """
+    Background thread counting the stacks of registered threads.
+
+    The thread only runs while some thread is registered, and gets restarted in
+    each process forked afterwards.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Threads do not survive a fork
+        self._condition = threading.Condition()
+        self._stacks = {}
+        self._thread = None
+
+    def start(self, thread_id):
+        """Start counting the stacks of a thread."""
+        with self._condition:
+            self._stacks[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="kerkoapp-profiler", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self, thread_id):
+        """Stop counting the stacks of a thread, and return their counts."""
+        with self._condition:
+            return self._stacks.pop(thread_id, Counter())
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._condition:
+                while not self._stacks:
+                    self._condition.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()  # noqa: SLF001
+            with self._condition:
+                for thread_id, counts in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own_id:
+                        counts[fold_stack(frame)] += 1
+            del frames
+
+
+def fold_stack(frame):
+    """Return the stack of `frame`, outermost first, in the folded format."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles slow or sampled requests."""
+
+    def __init__(self, wsgi_app, app, settings, directory):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.settings = settings
+        self.directory = Path(directory)
+        self.sampler = StackSampler(settings.interval)
+        # Only one request at a time runs under cProfile: since Python 3.12,
+        # a profiler covers every thread.
+        self._cprofile_lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def __call__(self, environ, start_response):
+        if environ.get(UNRECORDED_KEY):
+            return self.wsgi_app(environ, start_response)
+        profiler = None
+        if random.random() < self.settings.sample_rate and self._cprofile_lock.acquire(False):
+            profiler = cProfile.Profile()
+        thread_id = threading.get_ident()
+        if profiler:
+            profiler.enable()
+        else:
+            self.sampler.start(thread_id)
+        start_time = time.perf_counter()
+
+        def finish():
+            elapsed = time.perf_counter() - start_time
+            if profiler:
+                profiler.disable()
+                self._cprofile_lock.release()
+                self.save(environ, elapsed, "prof", profiler.dump_stats)
+            else:
+                stacks = self.sampler.stop(thread_id)
+                if stacks and elapsed >= self.settings.slow_threshold:
+                    self.save(environ, elapsed, "folded", lambda path: write_folded(path, stacks))
+
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except Exception:
+            finish()
+            raise
+        return ClosingIterator(body, finish)
+
+    def save(self, environ, elapsed, kind, write):
+        endpoint = re.sub(r"[^\w.-]", "_", environ.get("kerkoapp.endpoint") or "unknown")
+        filename = "{}-{}-{}-{}-{}ms.{}".format(
+            time.strftime("%Y%m%dT%H%M%S"),
+            os.getpid(),
+            next(self._sequence),
+            endpoint,
+            round(elapsed * 1000),
+            kind,
+        )
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            write(str(self.directory / filename))
+            prune_profiles(self.directory, self.settings.max_files, self.settings.max_bytes)
+        except OSError as e:
+            # Profiling must never break requests
+            self.app.logger.warning("Unable to save profile %s: %s", filename, e)
+            return
+        registry.inc("kerkoapp_profiles_written_total", {"kind": kind})
+
+
+def write_folded(path, stacks):
+    with Path(path).open("w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def prune_profiles(directory, max_files, max_bytes):
+    """Delete the oldest profiles until the directory is within limits."""
+    profiles = []
+    for path in Path(directory).iterdir():
+        if path.suffix not in PROFILE_SUFFIXES:
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue  # Deleted by another process
+        profiles.append((stat.st_mtime, stat.st_size, path))
+    profiles.sort()
+    count = len(profiles)
+    total_size = sum(size for _, size, _ in profiles)
+    for _, size, path in profiles:
+        if count <= max_files and total_size <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        count -= 1
+        total_size -= size
+
+
+def init_app(app: Flask) -> None:
+    settings = kerkoapp_config(app).profiling
+    if not settings.enabled:
+        return
+
+    @app.before_request
+    def _record_endpoint():
+        request.environ["kerkoapp.endpoint"] = request.endpoint
+
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app, app, settings, Path(app.instance_path) / "profiles"
+    )
@@ -0,0 +1,180 @@
+"""
+In-memory cache of the search results pages rendered by Kerko.
+
+Kerko's search view reruns the Whoosh query, with its facets, on every request,
+although a few searches, such as those linked from the landing page, make up
+most of the traffic. `init_app` wraps that view so that rendered pages get kept
+in a bounded LRU cache, by locale and normalized query string, and served from
+there until the index changes. Any commit to the index, or its recreation,
+invalidates every page at once.
+
+Under ASGI, pages found in the cache get served right in the event loop, like
+the pages of `kerkoapp.http_caching` (see `kerkoapp.asgi`), even if the index
+changes in the meantime.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Flask, make_response, request, session
+from flask_babel import get_locale
+from werkzeug.wrappers import Response
+
+from . import metrics
+from .caching import get_index_version
+from .config_helpers import kerkoapp_config
+from .http_caching import CACHED_ANSWER_KEY
+from .indexes import get_whoosh_dir
+
+SEARCH_ENDPOINT = "kerko.search"
+
+
+class PageCache:
+    """
+    Keep rendered pages in memory, evicting the least recently used ones.
+
+    The cache is bounded by its number of pages and by their total size, and
+    holds the pages of a single generation of the data: a lookup with any other
+    generation empties it. A process forked afterwards keeps the pages, but
+    starts with a fresh lock and counters.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._generation = None
+        self.size = 0
+        self._reset_after_fork()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, generation, key):
+        """Return the page cached for `key`, or `None`."""
+        with self._lock:
+            self._check_generation(generation)
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def peek(self, generation, key):
+        """Return what `get` would, without counting a lookup."""
+        with self._lock:
+            return self._pages.get(key) if self._generation == generation else None
+
+    def count_hit(self):
+        """Count a lookup of a page found by `peek`."""
+        with self._lock:
+            self.hits += 1
+
+    def put(self, generation, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            if key in self._pages:
+                self.size -= len(self._pages.pop(key)[0])
+            self._pages[key] = (body, mimetype)
+            self.size += len(body)
+            while len(self._pages) > self.max_entries or self.size > self.max_bytes:
+                evicted_body, _mimetype = self._pages.popitem(last=False)[1]
+                self.size -= len(evicted_body)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._generation = None
+            self.size = 0
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            if self._pages:
+                self.invalidations += 1
+            self._pages.clear()
+            self.size = 0
+            self._generation = generation
+
+
+def get_page_key():
+    """
+    Return the key of the page requested, or `None` if it must not be cached.
+
+    Query string arguments get sorted by name, keeping the order of the values
+    of each argument, which may matter to the page.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    # Messages flashed by an earlier request get shown once, in the page
+    if "_flashes" in session:
+        return None
+    args = sorted(request.args.items(multi=True), key=lambda arg: arg[0])
+    return (request.root_url, str(get_locale()), tuple(args))
+
+
+def get_generation():
+    return get_index_version(get_whoosh_dir("index"))
+
+
+def cached_search(view, cache):
+    """Wrap Kerko's search view to serve its pages from `cache`."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        page = request.environ.get(CACHED_ANSWER_KEY)
+        if page is not None:
+            # Found by `find_cached` beforehand, served even if stale by now
+            cache.count_hit()
+            return Response(page[0], mimetype=page[1])
+        key = get_page_key()
+        if key is None:
+            return view(*args, **kwargs)
+        generation = get_generation()
+        page = cache.get(generation, key)
+        if page is not None:
+            return Response(page[0], mimetype=page[1])
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:  # noqa: PLR2004
+            cache.put(generation, key, response.get_data(), response.mimetype)
+        return response
+
+    def find_cached():
+        key = get_page_key()
+        return None if key is None else cache.peek(get_generation(), key)
+
+    wrapper.kerkoapp_find_cached = find_cached
+    return wrapper
+
+
+def init_app(app: Flask) -> None:
+    """Wrap Kerko's search view. This must be called after registering Kerko's blueprint."""
+    settings = kerkoapp_config(app).search_cache
+    if not settings.enabled:
+        return
+    cache = PageCache(settings.max_entries, settings.max_bytes)
+    app.extensions["kerkoapp_search_cache"] = cache
+    app.view_functions[SEARCH_ENDPOINT] = cached_search(app.view_functions[SEARCH_ENDPOINT], cache)
+    metrics.register_collector(metrics.cache_collector("search_pages", cache))
@@ -0,0 +1,221 @@
+"""
+Library-wide dashboard statistics, maintained incrementally at sync time.
+
+The counts by year and by item type, the totals and the most cited works are
+kept along with a small summary of each item, keyed by item key. After each
+Kerko sync, the items changed since the previous update (see
+`kerkoapp.deltas`) get applied as deltas: a removed item gets subtracted from
+the aggregates, an added item gets added to them, and an updated item is both.
+Hence a sync that changes a handful of items only costs a handful of updates,
+instead of a pass over the whole library.
+
+Like Kerko's search index, the statistics cover the top-level items that pass
+Kerko's tag filters.
+"""
+
+import heapq
+from bisect import insort
+from collections import Counter
+from pathlib import Path
+
+from kerko.storage import get_storage_dir, open_index
+from kerko.tags import TagGate
+
+from .authors import get_filters, get_publication_year
+from .deltas import cache_changes, get_cache_version
+from .enrichment import get_citations, get_citations_generation, get_citations_view
+from .storage import load_pickle, save_pickle
+
+# Bump this whenever the layout of the state changes, so that a state written
+# by an older version gets rebuilt instead of being misread.
+STATS_STORE_VERSION = 2
+
+# Number of most cited works tracked. Keeping more than are shown leaves room
+# for removals before the list needs to be rebuilt from the item summaries.
+TOP_CANDIDATES = 25
+
+# Fields of the most cited items kept for display.
+TOP_DATA_FIELDS = ("key", "title", "creators", "date", "DOI", "url", "extra", "dateAdded")
+
+
+def get_state_path():
+    return Path(get_storage_dir("dashboard")) / "stats-state.pickle"
+
+
+def summarize_item(item, gate, citations_view):
+    """
+    Return what the statistics need to know about a cached item.
+
+    Return `None` for items that Kerko's search index would not include.
+    """
+    data = item.get("data", {})
+    if item.get("parentItem") or not gate.check(data):
+        return None
+    return {
+        "year": get_publication_year(item),
+        "item_type": data.get("itemType", "Unknown"),
+        "cited_by": get_citations(data, citations_view).cited_by or 0,
+        "date_added": data.get("dateAdded", ""),
+    }
+
+
+def rank_key(key, summary):
+    # Most cited first, then most recently added, like the "Most cited" sort
+    return (summary["cited_by"], summary["date_added"], key)
+
+
+def new_state():
+    return {
+        "version": STATS_STORE_VERSION,
+        "filters": get_filters(),
+        # Looked up citation counts that the state reflects.
+        "citations_generation": get_citations_generation(),
+        # Cache version at the time of the latest update.
+        "cache_version": 0,
+        # Summary of every cached item (`None` if not counted), by item key.
+        "items": {},
+        "years": Counter(),
+        "item_types": Counter(),
+        "works": 0,
+        "citations": 0,
+        # Rank keys of the most cited works, in ascending order. They always
+        # are the exact top of the ranking, although possibly a shorter one
+        # than `TOP_CANDIDATES` after removals.
+        "top": [],
+        # Displayable data of the most cited works, by item key.
+        "top_data": {},
+    }
+
+
+def load_state():
+    state = load_pickle(get_state_path())
+    if not isinstance(state, dict) or state.get("version") != STATS_STORE_VERSION:
+        return None
+    if state["filters"] != get_filters():
+        return None
+    # Citation counts looked up since then may change any item's summary
+    if state["citations_generation"] != get_citations_generation():
+        return None
+    # A cache older than the state has been cleaned and synced again
+    if state["cache_version"] > get_cache_version():
+        return None
+    return state
+
+
+def discard_top(state, key):
+    if key in state["top_data"]:
+        del state["top_data"][key]
+        state["top"] = [rank for rank in state["top"] if rank[2] != key]
+
+
+def remove_item(state, key):
+    summary = state["items"].pop(key, None)
+    if not summary:
+        return
+    if summary["year"]:
+        state["years"][summary["year"]] -= 1
+        if not state["years"][summary["year"]]:
+            del state["years"][summary["year"]]
+    state["item_types"][summary["item_type"]] -= 1
+    if not state["item_types"][summary["item_type"]]:
+        del state["item_types"][summary["item_type"]]
+    state["works"] -= 1
+    state["citations"] -= summary["cited_by"]
+    # What remains is still the exact top of the ranking
+    discard_top(state, key)
+
+
+def add_item(state, item, gate, citations_view):
+    key = item["key"]
+    summary = summarize_item(item, gate, citations_view)
+    state["items"][key] = summary
+    if not summary:
+        return
+    top = state["top"]
+    rank = rank_key(key, summary)
+    # The ranking only remains exact if the new item would rank within it, or
+    # if every work is already in it
+    if len(top) == state["works"] or (top and rank > top[0]):
+        insort(top, rank)
+        state["top_data"][key] = {field: item["data"].get(field) for field in TOP_DATA_FIELDS}
+        if len(top) > TOP_CANDIDATES:
+            dropped = top.pop(0)
+            del state["top_data"][dropped[2]]
+    if summary["year"]:
+        state["years"][summary["year"]] += 1
+    state["item_types"][summary["item_type"]] += 1
+    state["works"] += 1
+    state["citations"] += summary["cited_by"]
+
+
+def refill_top(state):
+    """Rebuild the most cited works from the item summaries."""
+    ranks = heapq.nlargest(
+        TOP_CANDIDATES,
+        (rank_key(key, summary) for key, summary in state["items"].items() if summary),
+    )
+    state["top"] = sorted(ranks)
+    missing = [rank[2] for rank in ranks if rank[2] not in state["top_data"]]
+    top_data = {
+        rank[2]: state["top_data"][rank[2]] for rank in ranks if rank[2] in state["top_data"]
+    }
+    if missing:
+        with open_index("cache").searcher() as searcher:
+            for key in missing:
+                fields = searcher.document(key=key) or {}
+                data = fields.get("data", {})
+                top_data[key] = {field: data.get(field) for field in TOP_DATA_FIELDS}
+    state["top_data"] = top_data
+
+
+def apply_changes(state, changes):
+    """
+    Apply the changes of Kerko's cache to the state.
+
+    Return the number of items added, updated or removed.
+    """
+    gate = TagGate(*state["filters"])
+    citations_view = get_citations_view()
+    count = 0
+    for key in changes.removed:
+        remove_item(state, key)
+        count += 1
+    for item in changes.items:
+        remove_item(state, item["key"])
+        add_item(state, item, gate, citations_view)
+        count += 1
+    state["cache_version"] = changes.version
+    return count
+
+
+def update_stats(top_n, full=False):
+    """
+    Update the statistics with the changes of Kerko's cache.
+
+    If there is no usable state from a previous update, or if `full` is true,
+    the statistics get rebuilt from every item.
+
+    Return the statistics, with the `top_n` most cited works, and the number
+    of items processed.
+
+    :raise SearchIndexError: If the cache is missing or empty.
+    """
+    state = None if full else load_state()
+    if state is None:
+        state = new_state()
+    with cache_changes(state["cache_version"], state["items"].keys()) as changes:
+        count = apply_changes(state, changes)
+    # Removals may have left too few works in the ranking
+    if len(state["top"]) < min(top_n, state["works"]):
+        refill_top(state)
+    save_pickle(get_state_path(), state)
+    return get_stats(state, top_n), count
+
+
+def get_stats(state, top_n):
+    return {
+        "top_cited": [state["top_data"][rank[2]] for rank in reversed(state["top"][-top_n:])],
+        "years": dict(sorted(state["years"].items())),
+        "item_types": dict(state["item_types"]),
+        "totals": {"works": state["works"], "citations": state["citations"]},
+    }
@@ -0,0 +1,24 @@
+"""
+Files of KerkoApp's own data, kept next to Kerko's under the instance directory.
+"""
+
+import pickle
+
+
+def load_pickle(path):
+    """Return the object pickled at `path`, or `None` if it cannot be read."""
+    try:
+        with path.open("rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save_pickle(path, obj):
+    """Pickle `obj` to `path`, atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Replacing the file is atomic, readers never see a partial file
+    tmp_path.replace(path)
@@ -0,0 +1,176 @@
+"""
+Warm-up of the caches after an index sync.
+
+After `flask kerko sync`, the first visitors would otherwise pay for reading the
+new index from disk, for opening its segments, and for compiling and rendering
+the templates. `warm_up_pages()` requests the most visited pages through the
+test client instead: the URLs listed in `[kerkoapp.warmup]`, the searches linked
+from the landing page, and the searches for the facet values matching the most
+items. The index files get read beforehand, to load them in the OS page cache.
+
+What gets primed is shared with the web server's processes: the OS page cache,
+the on-disk Jinja bytecode cache, and the on-disk stores built on first use.
+Caches kept in memory belong to the process rendering the pages, so the web
+workers still render each page once per index update.
+
+The timing of each URL gets logged, and appended to the warm-up history in
+`instance/kerko/warmup/history.jsonl`, one JSON object per run, for following
+the cost of a cold start over time. The warm-up requests themselves are kept
+out of the request metrics, the access log and the profiles.
+"""
+
+import html
+import json
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from flask import current_app, url_for
+from kerko.storage import SearchIndexError, get_storage_dir
+
+from .caching import get_index_generation
+from .config_helpers import kerkoapp_config
+from .indexes import get_whoosh_dir
+from .metrics import UNRECORDED_KEY
+
+HISTORY_FILENAME = "history.jsonl"
+
+READ_BLOCK_SIZE = 1_048_576
+
+SEARCH_LINK_RE = re.compile(r'href="(?P<url>[^"?]*\?[^"]*)"')
+
+
+def read_index_files():
+    """Read every file of the search index, and return the number of bytes read."""
+    total = 0
+    for path in sorted(Path(get_whoosh_dir("index")).glob("*")):
+        if not path.is_file():
+            continue
+        try:
+            with path.open("rb") as f:
+                while block := f.read(READ_BLOCK_SIZE):
+                    total += len(block)
+        except OSError as e:
+            current_app.logger.warning("Unable to read %s: %s", path, e)
+    return total
+
+
+def get_landing_search_urls(client):
+    """Return the URLs of the searches linked from the landing page."""
+    with current_app.test_request_context():
+        search_path = url_for("kerko.search")
+    response = client.get("/")
+    if response.status_code != 200:  # noqa: PLR2004
+        return []
+    urls = []
+    for m in SEARCH_LINK_RE.finditer(response.get_data(as_text=True)):
+        url = html.unescape(m.group("url"))
+        if urlsplit(url).path == search_path and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def iter_facet_items(items):
+    for item in items:
+        yield item
+        yield from iter_facet_items(item.get("children", []))
+
+
+def get_facet_urls(limit):
+    """Return the URLs of the searches for the facet values matching the most items."""
+    if not limit:
+        return []
+    from kerko.criteria import create_search_criteria
+    from kerko.searcher import Searcher
+    from kerko.shortcuts import composer
+    from kerko.storage import open_index
+
+    with current_app.test_request_context():
+        search_path = url_for("kerko.search")
+    # Facet URLs get built relative to the search page
+    with current_app.test_request_context(search_path):
+        criteria = create_search_criteria()
+        with Searcher(open_index("index")) as searcher:
+            results = searcher.search_page(
+                page=1,
+                page_len=1,
+                reject_any={"item_type": ["note", "attachment"]},
+                faceting=True,
+            )
+            facets = results.facets(composer().facets, criteria)
+    items = [
+        item
+        for facet_items in facets.values()
+        for item in iter_facet_items(facet_items)
+        if item.get("add_url")
+    ]
+    items.sort(key=lambda item: item["count"], reverse=True)
+    return [item["add_url"] for item in items[:limit]]
+
+
+def get_discovered_urls(client):
+    """Return the URLs of the searches linked from the landing page and of the top facet values."""
+    settings = kerkoapp_config(current_app).warmup
+    urls = []
+    if settings.landing_searches:
+        urls.extend(get_landing_search_urls(client))
+    try:
+        urls.extend(get_facet_urls(settings.facet_pages))
+    except SearchIndexError as e:
+        current_app.logger.warning("Unable to find the top facet values: %s", e)
+    return urls
+
+
+def request_page(client, url):
+    start_time = time.perf_counter()
+    response = client.get(url)
+    size = len(response.get_data())
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    response.close()
+    return {"url": url, "status": response.status_code, "bytes": size, "ms": elapsed_ms}
+
+
+def warm_up_pages(urls=None):
+    """
+    Request the pages worth warming up, and return the timing of each of them.
+
+    The configured URLs get requested first, while everything is still cold,
+    then the discovered ones.
+
+    :param list urls: The URLs to request, instead of those of the configuration
+        and those discovered.
+
+    :return: A list of dicts with the `url`, `status`, `bytes` and `ms` of each
+        request, in the order of the requests.
+    """
+    start_time = time.perf_counter()
+    index_bytes = read_index_files()
+    read_ms = (time.perf_counter() - start_time) * 1000
+    current_app.logger.info("Read %d byte(s) of index files in %.0f ms.", index_bytes, read_ms)
+
+    client = current_app.test_client()
+    client.environ_base[UNRECORDED_KEY] = True
+    discover = not urls
+    urls = list(dict.fromkeys(urls or kerkoapp_config(current_app).warmup.urls))
+    timings = [request_page(client, url) for url in urls]
+    if discover:
+        discovered = dict.fromkeys(get_discovered_urls(client))
+        timings.extend(request_page(client, url) for url in discovered if url not in urls)
+    return timings
+
+
+def save_history(timings):
+    """Append the timings of a run to the warm-up history, and return the file's path."""
+    path = get_storage_dir("warmup") / HISTORY_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "generation": get_index_generation(get_whoosh_dir("index")),
+        "total_ms": round(sum(timing["ms"] for timing in timings), 1),
+        "urls": [{**timing, "ms": round(timing["ms"], 1)} for timing in timings],
+    }
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return path
@@ -1,9 +1,7 @@
 import errno
 import sys
 
-from kerko.config_helpers import config_get
-
-from kerkoapp import create_app
+from kerkoapp import apply_proxy_fix, create_app
 
 try:
     app = create_app()
@@ -12,18 +10,7 @@ except RuntimeError as e:
     sys.exit(errno.EINTR)  # This should make the WSGI server exit as well.
 
 
-try:
-    proxy_fix_config = config_get(app.config, "kerkoapp.proxy_fix")
-except KeyError:
-    pass
-else:
-    if proxy_fix_config.get("enabled"):
-        from werkzeug.middleware.proxy_fix import ProxyFix
-
-        app.wsgi_app = ProxyFix(
-            app.wsgi_app,
-            **{kwarg: value for kwarg, value in proxy_fix_config.items() if kwarg != "enabled"},
-        )
+apply_proxy_fix(app)
 
 
 @app.shell_context_processor